@@ -1,52 +1,374 @@
-from fastapi import FastAPI, APIRouter, HTTPException
+from fastapi import FastAPI, APIRouter, Header, HTTPException, Query, Request, Response
 from dotenv import load_dotenv
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+import io
 import os
+import marshal
+import csv
+import json
+import time
+import base64
+import bisect
+import pstats
+import random
+import hashlib
+import cProfile
+import functools
+import asyncio
 import logging
+import math
+import threading
+import multiprocessing
+import heapq
+import orjson
+import numpy as np
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextvars import ContextVar
 from pathlib import Path
 from pydantic import BaseModel, Field
-from typing import List, Optional, Dict
-from datetime import datetime, timedelta
+from typing import List, Literal, Optional, Dict
+from datetime import date, datetime, timedelta
 from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, IndexModel, ReadPreference, ReturnDocument, UpdateOne, monitoring
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
+# Metrics
+# Prometheus-format histograms served from /api/metrics. MetricsMiddleware
+# times every request under its route template; phases inside a request
+# (parsing, generation, serialization, Mongo commands) find the route
+# through the request scope held in the _metrics_scope context variable,
+# which Motor carries into its executor threads.
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (128, 512, 2048, 8192, 32768, 131072, 524288, 2097152, 8388608)
+
+_metrics_scope: ContextVar[Optional[Dict]] = ContextVar('metrics_scope', default=None)
+
+def prometheus_labels(names, values) -> str:
+    if not names:
+        return ''
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{value}"')
+    return '{' + ','.join(pairs) + '}'
+
+class Histogram:
+    """Cumulative histogram with one series per combination of label values"""
+
+    def __init__(self, name: str, help_text: str, label_names: tuple, buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series: Dict[tuple, list] = {}  # labels -> [bucket counts, sum]
+        self._lock = threading.Lock()  # Mongo events arrive on Motor's threads
+
+    def observe(self, value: float, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self) -> List[str]:
+        with self._lock:
+            series = sorted((labels, list(counts), total) for labels, (counts, total) in self._series.items())
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        bounds = [repr(float(bound)) for bound in self.buckets] + ['+Inf']
+        for labels, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                bucket_labels = prometheus_labels(self.label_names + ('le',), labels + (bound,))
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            series_labels = prometheus_labels(self.label_names, labels)
+            lines.append(f"{self.name}_sum{series_labels} {total}")
+            lines.append(f"{self.name}_count{series_labels} {cumulative}")
+        return lines
+
+REQUEST_DURATION = Histogram(
+    'http_request_duration_seconds', 'Time to serve a request, including streaming the body',
+    ('method', 'route', 'status'),
+)
+RESPONSE_SIZE = Histogram(
+    'http_response_size_bytes', 'Response body size', ('method', 'route'), SIZE_BUCKETS,
+)
+PHASE_DURATION = Histogram(
+    'request_phase_duration_seconds', 'Time spent in one phase of handling a request',
+    ('route', 'phase'),
+)
+MONGO_DURATION = Histogram(
+    'mongo_command_duration_seconds', 'MongoDB command round trip', ('route', 'command'),
+)
+HISTOGRAMS = (REQUEST_DURATION, RESPONSE_SIZE, PHASE_DURATION, MONGO_DURATION)
+
+def current_route() -> str:
+    """Route template of the request being handled, for metric labels"""
+    scope = _metrics_scope.get()
+    if scope is None:
+        return 'background'
+    route = scope.get('route')
+    return getattr(route, 'path', 'unmatched')
+
+def observe_phase(phase: str, seconds: float):
+    PHASE_DURATION.observe(seconds, current_route(), phase)
+
+def observe_parse():
+    """Record the time from request arrival until the handler runs (body read and validation)"""
+    scope = _metrics_scope.get()
+    if scope is not None and 'metrics_started' in scope:
+        observe_phase('parse', time.perf_counter() - scope['metrics_started'])
+
+class MetricsMiddleware:
+    """ASGI middleware timing each HTTP request and counting the response bytes sent"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        started = scope['metrics_started'] = time.perf_counter()
+        token = _metrics_scope.set(scope)
+        status = 500
+        size = 0
+
+        async def send_counted(message):
+            nonlocal status, size
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            elif message['type'] == 'http.response.body':
+                size += len(message.get('body', b''))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_counted)
+        finally:
+            _metrics_scope.reset(token)
+            route = getattr(scope.get('route'), 'path', 'unmatched')
+            REQUEST_DURATION.observe(time.perf_counter() - started, scope['method'], route, str(status))
+            RESPONSE_SIZE.observe(size, scope['method'], route)
+
+class MongoCommandTimer(monitoring.CommandListener):
+    """Feeds MongoDB command durations into MONGO_DURATION"""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        MONGO_DURATION.observe(event.duration_micros / 1e6, current_route(), event.command_name)
+
+    def failed(self, event):
+        MONGO_DURATION.observe(event.duration_micros / 1e6, current_route(), event.command_name)
+
+class PoolMonitor(monitoring.ConnectionPoolListener):
+    """
+    Connection pool gauges and checkout waits. Checkouts run on the thread
+    that issues the command, so the wait is timed with a thread-local start.
+    """
+
+    def __init__(self):
+        self.checkout_wait = Histogram(
+            'mongo_pool_checkout_wait_seconds', 'Time spent waiting for a pooled connection', (),
+        )
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._stats = {
+            'connections': 0,
+            'checked_out': 0,
+            'max_checked_out': 0,
+            'checkouts': 0,
+            'checkout_failures': 0,
+            'checkout_timeouts': 0,
+            'checkout_wait_total': 0.0,
+            'checkout_wait_max': 0.0,
+            'pool_clears': 0,
+        }
+
+    def _add(self, key: str, amount: int = 1):
+        with self._lock:
+            self._stats[key] += amount
+            if key == 'checked_out':
+                self._stats['max_checked_out'] = max(self._stats['max_checked_out'], self._stats['checked_out'])
+
+    def _waited(self):
+        started = getattr(self._local, 'started', None)
+        self._local.started = None
+        wait = time.perf_counter() - started if started is not None else 0.0
+        self.checkout_wait.observe(wait)
+        with self._lock:
+            self._stats['checkout_wait_total'] += wait
+            self._stats['checkout_wait_max'] = max(self._stats['checkout_wait_max'], wait)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return dict(self._stats)
+
+    def connection_check_out_started(self, event):
+        self._local.started = time.perf_counter()
+
+    def connection_checked_out(self, event):
+        self._waited()
+        self._add('checkouts')
+        self._add('checked_out')
+
+    def connection_check_out_failed(self, event):
+        self._waited()
+        self._add('checkout_failures')
+        if event.reason == monitoring.ConnectionCheckOutFailedReason.TIMEOUT:
+            self._add('checkout_timeouts')
+
+    def connection_checked_in(self, event):
+        self._add('checked_out', -1)
+
+    def connection_created(self, event):
+        self._add('connections')
+
+    def connection_closed(self, event):
+        self._add('connections', -1)
+
+    def pool_cleared(self, event):
+        self._add('pool_clears')
+
+    def connection_ready(self, event):
+        pass
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+def stats_gauges(prefix: str, stats: Dict) -> List[str]:
+    """Numeric entries of a stats() dict as Prometheus gauges"""
+    lines = []
+    for key, value in stats.items():
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            continue
+        lines.append(f"# TYPE {prefix}_{key} gauge")
+        lines.append(f"{prefix}_{key} {value}")
+    return lines
+
 # MongoDB connection
+# Pool limits, timeouts and wire compression come from the environment.
+# MONGO_WAIT_QUEUE_TIMEOUT_MS bounds how long a request queues for a pooled
+# connection under load. MONGO_COMPRESSORS takes a comma-separated list
+# (zstd needs the zstandard package, snappy needs python-snappy).
+# MONGO_READ_PREFERENCE applies to the read-only GET endpoints only; with a
+# secondary mode those reads, ETag checks included, may briefly lag writes.
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+READ_PREFERENCES = {
+    'primary': ReadPreference.PRIMARY,
+    'primaryPreferred': ReadPreference.PRIMARY_PREFERRED,
+    'secondary': ReadPreference.SECONDARY,
+    'secondaryPreferred': ReadPreference.SECONDARY_PREFERRED,
+    'nearest': ReadPreference.NEAREST,
+}
+MONGO_READ_PREFERENCE = os.environ.get('MONGO_READ_PREFERENCE', 'primary')
+if MONGO_READ_PREFERENCE not in READ_PREFERENCES:
+    raise ValueError(f"Unknown MONGO_READ_PREFERENCE: {MONGO_READ_PREFERENCE}")
+
+def mongo_client_options() -> Dict:
+    """Motor client keyword arguments from the MONGO_* environment variables"""
+    options = {
+        'maxPoolSize': int(os.environ.get('MONGO_MAX_POOL_SIZE', '100')),
+        'minPoolSize': int(os.environ.get('MONGO_MIN_POOL_SIZE', '0')),
+        'waitQueueTimeoutMS': int(os.environ.get('MONGO_WAIT_QUEUE_TIMEOUT_MS', '5000')),
+        'serverSelectionTimeoutMS': int(os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', '5000')),
+        'connectTimeoutMS': int(os.environ.get('MONGO_CONNECT_TIMEOUT_MS', '10000')),
+    }
+    max_idle = os.environ.get('MONGO_MAX_IDLE_TIME_MS')
+    if max_idle:
+        options['maxIdleTimeMS'] = int(max_idle)
+    compressors = os.environ.get('MONGO_COMPRESSORS', '').strip()
+    if compressors:
+        options['compressors'] = compressors
+    return options
+
+pool_monitor = PoolMonitor()
+client = AsyncIOMotorClient(
+    mongo_url,
+    event_listeners=[MongoCommandTimer(), pool_monitor],
+    **mongo_client_options(),
+)
 db = client[os.environ['DB_NAME']]
 
+def read_db():
+    """Database handle for read-only endpoints, honouring MONGO_READ_PREFERENCE"""
+    if MONGO_READ_PREFERENCE == 'primary':
+        return db
+    return db.with_options(read_preference=READ_PREFERENCES[MONGO_READ_PREFERENCE])
+
 # Create the main app without a prefix
 app = FastAPI()
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
 
-# Helper function to convert ObjectId to string
-def serialize_doc(doc):
-    """Recursively convert ObjectId to string in nested documents"""
-    if isinstance(doc, dict):
-        result = {}
-        for key, value in doc.items():
-            if key == '_id' and isinstance(value, ObjectId):
-                result['id'] = str(value)
-            elif isinstance(value, ObjectId):
-                result[key] = str(value)
-            elif isinstance(value, dict):
-                result[key] = serialize_doc(value)
-            elif isinstance(value, list):
-                result[key] = [serialize_doc(item) if isinstance(item, (dict, ObjectId)) else item for item in value]
-            else:
-                result[key] = value
-        return result
-    elif isinstance(doc, ObjectId):
-        return str(doc)
-    elif isinstance(doc, list):
-        return [serialize_doc(item) if isinstance(item, (dict, ObjectId)) else item for item in doc]
-    else:
-        return doc
+# Fast JSON responses
+# Handlers return FastJSONResponse directly, which skips FastAPI's
+# response_model validation and jsonable_encoder walk; orjson encodes the
+# Mongo documents in one pass and turns nested ObjectIds into strings.
+def orjson_default(value):
+    if isinstance(value, ObjectId):
+        return str(value)
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+class FastJSONResponse(JSONResponse):
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        started = time.perf_counter()
+        body = orjson.dumps(content, default=orjson_default)
+        observe_phase('serialize', time.perf_counter() - started)
+        return body
+
+def public_doc(doc: Dict) -> Dict:
+    """Expose a Mongo document's _id as a string `id`"""
+    if '_id' in doc:
+        doc['id'] = str(doc.pop('_id'))
+    return doc
+
+# Opaque pagination cursor over the (created_at, _id) sort key
+def encode_cursor(created_at: str, oid: ObjectId) -> str:
+    raw = f"{created_at}|{oid}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor: str):
+    padded = cursor + '=' * (-len(cursor) % 4)
+    created_at, oid = base64.urlsafe_b64decode(padded.encode()).decode().split('|')
+    return created_at, ObjectId(oid)
+
+# Conditional GET. Plans carry a `version` that every write $inc's in the
+# same update, so (id, version) identifies a plan's representation.
+def plan_etag(plan_id, version: int) -> str:
+    return f'"{plan_id}-v{version}"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header covers `etag` (weak comparison)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    return etag in {tag.strip().removeprefix('W/') for tag in if_none_match.split(',')}
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={'ETag': etag, 'Cache-Control': 'no-cache'})
 
 # Define Models
 class Topic(BaseModel):
@@ -64,8 +386,11 @@ class StudyPlanCreate(BaseModel):
     subjects: List[Subject]
     daily_hours: float
     start_date: Optional[str] = None  # ISO format date
+    student_id: Optional[str] = None
+    strategy: Literal['greedy', 'edf'] = 'greedy'  # see SCHEDULING_STRATEGIES
 
 class StudySession(BaseModel):
+    id: Optional[str] = None  # compact per-plan identifier, e.g. "s1f"
     subject: str
     topic: str
     date: str
@@ -81,6 +406,9 @@ class StudyPlan(BaseModel):
     start_date: str
     sessions: List[StudySession]
     created_at: str = Field(default_factory=lambda: datetime.utcnow().isoformat())
+    student_id: Optional[str] = None
+    strategy: Literal['greedy', 'edf'] = 'greedy'
+    version: int = 1  # bumped on every write, see plan_etag
 
 class UpdateSessionStatus(BaseModel):
     date: str
@@ -88,16 +416,181 @@ class UpdateSessionStatus(BaseModel):
     topic: str
     completed: bool
 
+class StudentOverride(BaseModel):
+    student_id: Optional[str] = None
+    daily_hours: Optional[float] = None
+    start_date: Optional[str] = None
+    difficulties: Dict[str, Dict[str, str]] = {}  # subject -> topic -> 'weak' or 'strong'
+
+class BatchStudyPlanCreate(BaseModel):
+    plans: List[StudyPlanCreate] = []
+    template: Optional[StudyPlanCreate] = None
+    overrides: List[StudentOverride] = []  # one plan per override of `template`
+
+class PatchSession(BaseModel):
+    completed: bool
+
+class PatchSessionItem(BaseModel):
+    id: str
+    completed: bool
+
+class BulkPatchSessions(BaseModel):
+    sessions: List[PatchSessionItem]
+
+class TopicAddition(BaseModel):
+    subject: str
+    topic: Topic
+
+class TopicRef(BaseModel):
+    subject: str
+    topic: str
+
+class RescheduleRequest(BaseModel):
+    from_date: Optional[str] = None  # ISO format date, defaults to today
+    add_topics: List[TopicAddition] = []
+    remove_topics: List[TopicRef] = []
+    exam_dates: Dict[str, str] = {}  # subject name -> new exam date
+    daily_hours: Optional[float] = None
+    missed_session_ids: List[str] = []  # past sessions to schedule again
+
+class SimulationRequest(BaseModel):
+    subjects: List[Subject]
+    daily_hours: List[float]
+    start_dates: List[str] = []  # ISO format dates, defaults to today
+
+def session_id(seq: int) -> str:
+    """Compact session identifier, unique within a plan"""
+    return f"s{seq:x}"
+
+def next_session_seq(sessions: List[Dict]) -> int:
+    """First sequence number not used by any of the plan's session IDs"""
+    highest = -1
+    for session in sessions:
+        sid = session.get('id') or ''
+        if sid.startswith('s'):
+            try:
+                highest = max(highest, int(sid[1:], 16))
+            except ValueError:
+                pass
+    return highest + 1
+
+# Per-date occupancy index used by the scheduler
+class DayCalendar:
+    """
+    Tracks how many sessions are booked on each day so the scheduler can
+    find the next slot on a day with a dict lookup instead of scanning every
+    session generated so far. Days are proleptic Gregorian ordinals
+    (`date.toordinal()`).
+    """
+    __slots__ = ('_booked', '_hours')
+
+    def __init__(self):
+        self._booked: Dict[int, int] = {}
+        self._hours: Dict[int, float] = {}
+
+    def booked(self, day: int) -> int:
+        """Number of sessions already placed on `day`"""
+        return self._booked.get(day, 0)
+
+    def booked_hours(self, day: int) -> float:
+        """Study hours already placed on `day`"""
+        return self._hours.get(day, 0.0)
+
+    def book(self, day: int, hours: float = 0.0) -> int:
+        """Reserve the next slot on `day` and return its index"""
+        index = self._booked.get(day, 0)
+        self._booked[day] = index + 1
+        if hours:
+            self._hours[day] = self._hours.get(day, 0.0) + hours
+        return index
+
+# Compact session representation used inside the scheduler
+class SessionColumns:
+    """
+    Sessions as parallel typed arrays (one row per session) rather than one
+    model object with formatted strings each. Dates are day ordinals and
+    times are minutes of the day; dicts and models are only built when the
+    schedule leaves the engine.
+    """
+    __slots__ = ('topic_names', 'topic', 'day', 'start_min', 'end_min', 'duration')
+
+    def __init__(self):
+        self.topic_names: List[tuple] = []  # (subject name, topic name) per topic index
+        self.topic = array('I')
+        self.day = array('i')
+        self.start_min = array('H')
+        self.end_min = array('I')
+        self.duration = array('d')
+
+    def __len__(self) -> int:
+        return len(self.day)
+
+    def add_topic(self, subject_name: str, topic_name: str) -> int:
+        self.topic_names.append((subject_name, topic_name))
+        return len(self.topic_names) - 1
+
+    def append(self, topic_index: int, day: int, start_min: int, end_min: int, duration: float):
+        self.topic.append(topic_index)
+        self.day.append(day)
+        self.start_min.append(start_min)
+        self.end_min.append(end_min)
+        self.duration.append(duration)
+
+    def order(self) -> List[int]:
+        """Row indexes by (day, start minute), keeping insertion order for ties"""
+        keys = [day * 65536 + minute for day, minute in zip(self.day, self.start_min)]
+        return sorted(range(len(keys)), key=keys.__getitem__)
+
+    def to_dicts(self, first_seq: int = 0) -> List[Dict]:
+        """Materialize the sessions in schedule order as StudySession-shaped dicts"""
+        dates: Dict[int, str] = {}
+        sessions = []
+        for seq, row in enumerate(self.order(), first_seq):
+            day = self.day[row]
+            day_name = dates.get(day)
+            if day_name is None:
+                day_name = dates[day] = date.fromordinal(day).isoformat()
+            subject_name, topic_name = self.topic_names[self.topic[row]]
+            start_min = self.start_min[row]
+            end_min = self.end_min[row]
+            sessions.append({
+                'id': session_id(seq),
+                'subject': subject_name,
+                'topic': topic_name,
+                'date': day_name,
+                'start_time': f"{start_min // 60:02d}:{start_min % 60:02d}",
+                'end_time': f"{end_min // 60:02d}:{end_min % 60:02d}",
+                'duration': self.duration[row],
+                'completed': False,
+            })
+        return sessions
+
+def minute_of_day(hour: float) -> int:
+    """Whole minutes of a fractional hour, truncated like the HH:MM strings"""
+    return int(hour) * 60 + int((hour % 1) * 60)
+
 # Scheduling Algorithm
-def generate_study_schedule(subjects: List[Subject], daily_hours: float, start_date: str) -> List[StudySession]:
+DAY_WINDOW_HOURS = 12.0  # sessions run between 9:00 and 21:00
+
+def schedule_session_columns(
+    subjects: List[Subject],
+    daily_hours: float,
+    start_date: str,
+    calendar: Optional[DayCalendar] = None,
+) -> SessionColumns:
     """
     Smart scheduling algorithm that considers:
     - Exam dates (prioritize closer exams)
     - Weak vs strong topics (more time for weak topics)
     - Spaced repetition principles
+
+    `calendar` may carry bookings from sessions that already exist, so new
+    sessions start after the hours kept on a day and move on to the next day
+    once it holds `daily_hours`.
     """
-    sessions = []
+    columns = SessionColumns()
     start = datetime.fromisoformat(start_date)
+    seeded = calendar is not None
     
     # Calculate total study time needed and prioritize subjects
     subject_data = []
@@ -105,7 +598,6 @@ def generate_study_schedule(subjects: List[Subject], daily_hours: float, start_d
         exam_date = datetime.fromisoformat(subject.exam_date)
         days_until_exam = (exam_date - start).days
         
-        total_hours = sum(topic.hours_needed for topic in subject.topics)
         weak_topics = [t for t in subject.topics if t.difficulty == 'weak']
         strong_topics = [t for t in subject.topics if t.difficulty == 'strong']
         
@@ -114,9 +606,15 @@ def generate_study_schedule(subjects: List[Subject], daily_hours: float, start_d
         strong_hours = sum(t.hours_needed for t in strong_topics)
         adjusted_total = weak_hours + strong_hours
         
+        # The walk only lands on start's time of day, so an exam later in
+        # the day than that is first passed on the following day
+        exam_day = exam_date.toordinal()
+        if exam_date.time() > start.time():
+            exam_day += 1
+        
         subject_data.append({
             'subject': subject,
-            'exam_date': exam_date,
+            'exam_day': exam_day,
             'days_until_exam': days_until_exam,
             'total_hours': adjusted_total,
             'weak_topics': weak_topics,
@@ -128,17 +626,18 @@ def generate_study_schedule(subjects: List[Subject], daily_hours: float, start_d
     subject_data.sort(key=lambda x: x['priority'], reverse=True)
     
     # Generate schedule day by day
-    current_date = start
-    topic_schedules = {}  # Track when each topic is studied for spaced repetition
+    current_day = start.toordinal()
+    calendar = calendar or DayCalendar()
     
     for subject_info in subject_data:
         subject = subject_info['subject']
-        exam_date = subject_info['exam_date']
+        exam_day = subject_info['exam_day']
         
         # Schedule weak topics first with more time
         all_topics = subject_info['weak_topics'] + subject_info['strong_topics']
         
         for topic in all_topics:
+            topic_index = columns.add_topic(subject.name, topic.name)
             multiplier = 1.5 if topic.difficulty == 'weak' else 1.0
             hours_to_allocate = topic.hours_needed * multiplier
             
@@ -148,163 +647,2821 @@ def generate_study_schedule(subjects: List[Subject], daily_hours: float, start_d
             
             for session_num in range(sessions_for_topic):
                 # Find next available slot
-                while current_date >= exam_date:
-                    current_date -= timedelta(days=1)  # Move back if we've passed exam
+                if current_day >= exam_day:
+                    current_day = exam_day - 1  # Move back if we've passed exam
                 
                 # Calculate time slot
-                start_hour = 9 + (len([s for s in sessions if s.date == current_date.date().isoformat()]) * hours_per_session)
-                if start_hour + hours_per_session > 21:  # Don't schedule after 9 PM
-                    current_date += timedelta(days=1)
-                    start_hour = 9
+                if seeded:
+                    # Kept sessions vary in length: go by their hours
+                    start_hour = 9 + calendar.booked_hours(current_day)
+                    while calendar.booked(current_day) and (
+                        start_hour + hours_per_session > min(9 + daily_hours, 21) + 1e-9
+                    ):
+                        current_day += 1
+                        start_hour = 9 + calendar.booked_hours(current_day)
+                else:
+                    start_hour = 9 + (calendar.booked(current_day) * hours_per_session)
+                    if start_hour + hours_per_session > 21:  # Don't schedule after 9 PM
+                        current_day += 1
+                        start_hour = 9
+                calendar.book(current_day, hours_per_session)
                 
-                start_time = f"{int(start_hour):02d}:{int((start_hour % 1) * 60):02d}"
-                end_hour = start_hour + hours_per_session
-                end_time = f"{int(end_hour):02d}:{int((end_hour % 1) * 60):02d}"
-                
-                session = StudySession(
-                    subject=subject.name,
-                    topic=topic.name,
-                    date=current_date.date().isoformat(),
-                    start_time=start_time,
-                    end_time=end_time,
-                    duration=hours_per_session,
-                    completed=False
+                columns.append(
+                    topic_index,
+                    current_day,
+                    minute_of_day(start_hour),
+                    minute_of_day(start_hour + hours_per_session),
+                    hours_per_session,
                 )
-                sessions.append(session)
                 
                 # Space out sessions for the same topic
                 if session_num < sessions_for_topic - 1:
-                    current_date += timedelta(days=2)  # Space repetition
-    
-    # Sort sessions by date
-    sessions.sort(key=lambda x: (x.date, x.start_time))
+                    current_day += 2  # Space repetition
     
-    return sessions
+    return columns
 
-# API Routes
-@api_router.get("/")
-async def root():
-    return {"message": "Study Scheduler API"}
+class InfeasiblePlanError(ValueError):
+    """Raised when a plan's work cannot fit in the study window before its exams"""
 
-@api_router.post("/study-plans", response_model=Dict)
-async def create_study_plan(plan_data: StudyPlanCreate):
-    try:
-        # Set start date to today if not provided
-        start_date = plan_data.start_date or datetime.utcnow().date().isoformat()
-        
-        # Generate schedule
-        sessions = generate_study_schedule(
-            plan_data.subjects,
-            plan_data.daily_hours,
-            start_date
+def schedule_session_columns_edf(
+    subjects: List[Subject],
+    daily_hours: float,
+    start_date: str,
+    calendar: Optional[DayCalendar] = None,
+) -> SessionColumns:
+    """
+    Earliest-deadline-first allocation of topic sessions to days.
+
+    Topics are split into sessions no longer than a day's hours. Each session
+    is a job due the day before its exam and preferably released two days
+    after the topic's previous one. Every day from the start is visited in
+    turn; released jobs come off a heap keyed on deadline and are packed back
+    to back from 9:00 while the hours placed so far trail a levelled budget
+    (the smallest uniform daily load that meets every deadline) times the
+    days elapsed. Release days are soft: when the released jobs cannot keep
+    up with the budget, the earliest-due unreleased job is taken instead.
+
+    Days hold at most `daily_hours`, or the levelled budget when that is
+    higher, and never more than the 9:00-21:00 window. Jobs due today may use
+    the whole window. Jobs a walk leaves past their deadline are backfilled
+    into earlier days with window room; if neither walk can be repaired, every
+    job is packed deadline first onto the least loaded days. Work that still
+    does not fit raises InfeasiblePlanError. The walks are O(n log n) in the
+    number of sessions, backfilling O(days) per job it moves.
+    """
+    columns = SessionColumns()
+    start = datetime.fromisoformat(start_date)
+    start_day = start.toordinal()
+    calendar = calendar or DayCalendar()
+    window = DAY_WINDOW_HOURS
+    capacity = min(daily_hours, window)
+
+    # (release day, deadline day, order, topic index, hours)
+    jobs = []
+    for subject in subjects:
+        exam_day = datetime.fromisoformat(subject.exam_date).toordinal()
+        deadline = max(exam_day - 1, start_day)
+
+        # Weak topics first, matching the greedy engine
+        topics = (
+            [t for t in subject.topics if t.difficulty == 'weak']
+            + [t for t in subject.topics if t.difficulty == 'strong']
         )
-        
-        # Create study plan
-        study_plan = StudyPlan(
-            subjects=plan_data.subjects,
-            daily_hours=plan_data.daily_hours,
-            start_date=start_date,
-            sessions=sessions
+        for topic in topics:
+            topic_index = columns.add_topic(subject.name, topic.name)
+            multiplier = 1.5 if topic.difficulty == 'weak' else 1.0
+            hours_to_allocate = topic.hours_needed * multiplier
+            sessions_for_topic = max(1, int(hours_to_allocate / (capacity / 2)))
+            hours_per_session = hours_to_allocate / sessions_for_topic
+            for session_num in range(sessions_for_topic):
+                release = start_day + session_num * 2
+                jobs.append((release, deadline, len(jobs), topic_index, hours_per_session))
+    if not jobs:
+        return columns
+
+    # Levelled budget: the heaviest ratio of work due by a deadline to days available
+    budget = 0.0
+    due = 0.0
+    for deadline, hours in sorted((job[1], job[4]) for job in jobs):
+        due += hours
+        budget = max(budget, due / (deadline - start_day + 1))
+    # Catching up may go past daily_hours, up to the whole window
+    day_limit = min(max(capacity, budget), window)
+
+    jobs.sort()
+    for spaced in (True, False):
+        # Spacing may cost a deadline somewhere: then fall back to plain EDF order
+        placements, missed = edf_placements(jobs, start_day, budget, day_limit, calendar, spaced)
+        if missed:
+            missed = edf_backfill(jobs, start_day, placements, missed, calendar)
+        if not missed:
+            break
+    else:
+        # Last resort: pack every job, deadline first, onto the least loaded days
+        placements = []
+        missed = edf_backfill(jobs, start_day, placements, list(range(len(jobs))), calendar)
+    if missed:
+        short: Dict[str, float] = {}
+        for index in missed:
+            subject_name = columns.topic_names[jobs[index][3]][0]
+            short[subject_name] = short.get(subject_name, 0.0) + jobs[index][4]
+        detail = ', '.join(f"{name} ({hours:.1f}h)" for name, hours in short.items())
+        if budget > window:
+            reason = f"needs {budget:.1f}h a day, at most {window:g}h fit in a day"
+        else:
+            reason = f"its sessions do not pack into {window:g}h days"
+        raise InfeasiblePlanError(
+            f"Study work does not fit before the exams: {detail} left over; {reason}"
         )
-        
-        # Save to database
-        plan_dict = study_plan.dict(exclude={'id'})
-        result = await db.study_plans.insert_one(plan_dict)
-        plan_dict['id'] = str(result.inserted_id)
-        
-        # Ensure all nested objects are JSON serializable
-        return serialize_doc(plan_dict)
-    except Exception as e:
-        logging.error(f"Error creating study plan: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e))
 
-@api_router.get("/study-plans", response_model=List[Dict])
-async def get_study_plans():
-    try:
-        plans = await db.study_plans.find().sort('created_at', -1).to_list(100)
-        for plan in plans:
-            plan['id'] = str(plan['_id'])
-            del plan['_id']
-        return plans
-    except Exception as e:
-        logging.error(f"Error fetching study plans: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e))
+    # Sessions follow each other in whole minutes, so each one starts where
+    # the previous one on its day ended
+    day_end: Dict[int, int] = {}
+    for index, day, used in sorted(placements, key=lambda p: (p[1], p[2])):
+        hours = jobs[index][4]
+        start_min = day_end.get(day, minute_of_day(9 + used))
+        end_min = start_min + int(hours * 60 + 1e-9)
+        day_end[day] = end_min
+        calendar.book(day, hours)
+        columns.append(jobs[index][3], day, start_min, end_min, hours)
+    return columns
 
-@api_router.get("/study-plans/{plan_id}", response_model=Dict)
-async def get_study_plan(plan_id: str):
-    try:
-        plan = await db.study_plans.find_one({'_id': ObjectId(plan_id)})
-        if not plan:
-            raise HTTPException(status_code=404, detail="Study plan not found")
-        plan['id'] = str(plan['_id'])
-        del plan['_id']
-        return plan
-    except HTTPException:
-        raise  # Re-raise HTTPExceptions as-is
-    except Exception as e:
-        logging.error(f"Error fetching study plan: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e))
+def edf_placements(
+    jobs: List[tuple],
+    start_day: int,
+    budget: float,
+    day_limit: float,
+    calendar: DayCalendar,
+    spaced: bool,
+):
+    """
+    One walk over the days for schedule_session_columns_edf. Returns
+    (job index, day, hours already used that day) per placed job and the
+    indexes of jobs that missed their deadline. With `spaced`, released jobs
+    go first and unreleased ones are only pulled in when nothing released is
+    left; otherwise jobs are taken strictly by deadline.
+    """
+    ready = []  # released jobs by deadline
+    early = [(job[1], job[2], index) for index, job in enumerate(jobs)]  # every job by deadline
+    heapq.heapify(early)
+    done = [False] * len(jobs)
+    placements = []
+    missed = []
+    remaining = len(jobs)
+    next_job = 0
+    placed = 0.0
+    day = start_day
+    while remaining:
+        while next_job < len(jobs) and jobs[next_job][0] <= day:
+            heapq.heappush(ready, (jobs[next_job][1], jobs[next_job][2], next_job))
+            next_job += 1
 
-@api_router.put("/study-plans/{plan_id}/sessions", response_model=Dict)
-async def update_session_status(plan_id: str, update_data: UpdateSessionStatus):
+        used = calendar.booked_hours(day)
+        target = budget * (day - start_day + 1)
+        while True:
+            while ready and done[ready[0][2]]:
+                heapq.heappop(ready)
+            while early and done[early[0][2]]:
+                heapq.heappop(early)
+            if not early:
+                break
+            # Anything due today goes first, whatever its release day
+            source = early if early[0][0] <= day or not (spaced and ready) else ready
+            deadline, _, index = source[0]
+            hours = jobs[index][4]
+            urgent = deadline <= day
+            if not urgent and placed >= target - 1e-9:
+                break
+            # Up to the day limit, or into the rest of the window while
+            # catching up with the budget or placing work due today
+            catching_up = urgent or placed + hours <= target + 1e-9
+            if used + hours > (DAY_WINDOW_HOURS if catching_up else day_limit) + 1e-9:
+                break
+            heapq.heappop(source)
+            done[index] = True
+            remaining -= 1
+            placements.append((index, day, used))
+            used += hours
+            placed += hours
+
+        # Whatever is due today and still unplaced cannot be scheduled
+        while early and early[0][0] <= day:
+            _, _, index = heapq.heappop(early)
+            if not done[index]:
+                done[index] = True
+                remaining -= 1
+                missed.append(index)
+        day += 1
+    return placements, missed
+
+def edf_backfill(
+    jobs: List[tuple],
+    start_day: int,
+    placements: List[tuple],
+    missed: List[int],
+    calendar: DayCalendar,
+) -> List[int]:
+    """
+    Second chance for jobs an EDF walk left past their deadline. The walk
+    stops filling a day once it is on budget, so earlier days may still have
+    room in the 9:00-21:00 window; each missed job, earliest deadline and
+    longest first, goes on the least loaded day up to its deadline that
+    still fits it. Placements are appended in place; returns the jobs that
+    fit nowhere. Given no placements and every job, this packs from scratch.
+    """
+    used: Dict[int, float] = {}
+    for index, day, offset in placements:
+        used[day] = max(used.get(day, 0.0), offset + jobs[index][4])
+    still_missed = []
+    for index in sorted(missed, key=lambda i: (jobs[i][1], -jobs[i][4])):
+        deadline, hours = jobs[index][1], jobs[index][4]
+        best = None
+        for day in range(start_day, deadline + 1):
+            load = used.get(day, calendar.booked_hours(day))
+            if load + hours <= DAY_WINDOW_HOURS + 1e-9 and (best is None or load <= best[1]):
+                best = (day, load)
+        if best is None:
+            still_missed.append(index)
+            continue
+        day, load = best
+        placements.append((index, day, load))
+        used[day] = load + hours
+    return still_missed
+
+# Scheduling engines selectable per plan through StudyPlanCreate.strategy
+SCHEDULING_STRATEGIES = {
+    'greedy': schedule_session_columns,
+    'edf': schedule_session_columns_edf,
+}
+
+def generate_study_schedule(
+    subjects: List[Subject],
+    daily_hours: float,
+    start_date: str,
+    calendar: Optional[DayCalendar] = None,
+    strategy: str = 'greedy',
+) -> List[StudySession]:
+    """Schedule as StudySession models, sorted by date and numbered in order"""
+    columns = SCHEDULING_STRATEGIES[strategy](subjects, daily_hours, start_date, calendar)
+    return [StudySession(**session) for session in columns.to_dicts()]
+
+# Capacity simulation
+# Dry-run feasibility of a plan over a grid of (daily_hours, start_date)
+# scenarios without generating sessions. Subjects are ordered by exam and
+# their topic hours (weak topics x1.5, as scheduled) accumulated, so a
+# scenario is feasible when every exam's cumulative hours fit in the study
+# days before it at the scenario's daily load. Daily hours are capped at
+# the 12 hour 9:00-21:00 window the schedulers use.
+MAX_EFFECTIVE_DAILY_HOURS = 12.0
+SIMULATION_MAX_SCENARIOS = int(os.environ.get('SIMULATION_MAX_SCENARIOS', '10000'))
+
+def simulate_capacity(subjects: List[Subject], daily_hours: List[float], start_dates: List[str]) -> Dict:
+    """
+    Arrays over the (daily_hours, start_date) grid:
+    - required: smallest uniform daily load meeting every exam (per start
+      date; inf when an exam with work left is on or before the start)
+    - feasible: whether the effective daily hours reach it
+    - slack: spare hours at the tightest exam, negative when short
+    - overload_days: days that would need more than the effective hours,
+      counted up to the exam that sets the required load
+    - utilization: total hours over the hours available before the last exam
+    """
+    hours = np.minimum(np.asarray(daily_hours, dtype=float), MAX_EFFECTIVE_DAILY_HOURS)
+    starts = np.array([datetime.fromisoformat(value).toordinal() for value in start_dates])
+
+    demand = np.array([
+        sum(t.hours_needed * (1.5 if t.difficulty == 'weak' else 1.0) for t in subject.topics)
+        for subject in subjects
+    ], dtype=float)
+    exams = np.array([datetime.fromisoformat(subject.exam_date).toordinal() for subject in subjects])
+    keep = demand > 0
+    order = np.argsort(exams[keep], kind='stable')
+    exams = exams[keep][order]
+    cumulative = np.cumsum(demand[keep][order])
+    if cumulative.size == 0:
+        exams, cumulative = np.zeros(1, dtype=int), np.zeros(1)
+
+    # days[s, k]: study days from start s up to the day before exam k
+    days = np.maximum(exams[None, :] - starts[:, None], 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rate = np.where(days > 0, cumulative[None, :] / days, np.where(cumulative[None, :] > 0, np.inf, 0.0))
+    critical = rate.argmax(axis=1)
+    required = rate[np.arange(len(starts)), critical]
+    critical_days = days[np.arange(len(starts)), critical]
+
+    available = hours[:, None, None] * days[None, :, :]
+    slack = (available - cumulative[None, None, :]).min(axis=2)
+    feasible = required[None, :] <= hours[:, None] + 1e-9
+    overload_days = np.where(feasible, 0, critical_days[None, :])
+    total_available = available[:, :, -1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        utilization = np.where(total_available > 0, cumulative[-1] / total_available, np.inf)
+
+    return {
+        'effective_hours': hours,
+        'total_hours': float(cumulative[-1]),
+        'required': required,
+        'feasible': feasible,
+        'slack': slack,
+        'overload_days': overload_days,
+        'utilization': utilization,
+    }
+
+def finite_or_none(value: float, digits: int = 2) -> Optional[float]:
+    return round(value, digits) if math.isfinite(value) else None
+
+# Incremental rescheduling
+def apply_plan_edits(subjects: List[Subject], edits: RescheduleRequest) -> List[Subject]:
+    """Subjects with topic additions/removals and exam date changes applied"""
+    by_name = {subject.name: subject.copy(deep=True) for subject in subjects}
+    referenced = (
+        [edit.subject for edit in edits.add_topics]
+        + [edit.subject for edit in edits.remove_topics]
+        + list(edits.exam_dates)
+    )
+    unknown = sorted({name for name in referenced if name not in by_name})
+    if unknown:
+        raise ValueError(f"Unknown subjects: {', '.join(unknown)}")
+
+    for name, exam_date in edits.exam_dates.items():
+        datetime.fromisoformat(exam_date)
+        by_name[name].exam_date = exam_date
+    for edit in edits.remove_topics:
+        subject = by_name[edit.subject]
+        if not any(topic.name == edit.topic for topic in subject.topics):
+            raise ValueError(f"Unknown topic: {edit.subject}/{edit.topic}")
+        subject.topics = [topic for topic in subject.topics if topic.name != edit.topic]
+    for edit in edits.add_topics:
+        by_name[edit.subject].topics.append(edit.topic)
+    return [by_name[subject.name] for subject in subjects]
+
+def remaining_work(
+    subjects: List[Subject],
+    sessions: List[Dict],
+    from_date: str,
+    missed_ids: List[str],
+):
+    """
+    Split a plan at `from_date`. Sessions before it and completed sessions
+    are kept; incomplete sessions from `from_date` on are replaced. Returns
+    the subjects trimmed to the hours the kept sessions don't cover, a
+    calendar seeded with kept sessions on or after `from_date`, and the
+    names of subjects whose exam is already over.
+    """
+    missed = set(missed_ids)
+    covered: Dict[tuple, float] = {}
+    calendar = DayCalendar()
+    for session in sessions:
+        kept = session['date'] < from_date or session.get('completed')
+        if not kept:
+            continue
+        if session['date'] >= from_date:
+            calendar.book(date.fromisoformat(session['date']).toordinal(), session['duration'])
+        if session.get('completed') or session.get('id') not in missed:
+            key = (session['subject'], session['topic'])
+            covered[key] = covered.get(key, 0.0) + session['duration']
+
+    remaining = []
+    expired = []
+    for subject in subjects:
+        topics = []
+        for topic in subject.topics:
+            multiplier = 1.5 if topic.difficulty == 'weak' else 1.0
+            left = topic.hours_needed * multiplier - covered.get((subject.name, topic.name), 0.0)
+            if left > 1e-9:
+                topics.append(topic.copy(update={'hours_needed': left / multiplier}))
+        if not topics:
+            continue
+        if subject.exam_date <= from_date:
+            expired.append(subject.name)
+            continue
+        remaining.append(subject.copy(update={'topics': topics}))
+    return remaining, calendar, expired
+
+# Profiling
+# Opt-in cProfile capture. A request is profiled when it sends
+# "X-Profile: 1" or is picked at PROFILE_SAMPLE_RATE. The handler is
+# profiled on the event loop and schedule generation inside the worker,
+# which sends its stats back with the sessions. Only the PROFILE_KEEP
+# slowest profiles are kept, for /api/debug/profiles.
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', '0'))
+PROFILE_KEEP = int(os.environ.get('PROFILE_KEEP', '20'))
+PROFILE_HEADER = b'x-profile'
+SPEEDSCOPE_MIN_FRACTION = 0.001  # stacks below this share of the total time are dropped
+SPEEDSCOPE_MAX_DEPTH = 128
+
+class RequestProfile:
+    __slots__ = ('id', 'name', 'route', 'created_at', 'duration', 'stats', 'worker_stats')
+
+    def __init__(self, name: str, route: str):
+        self.id: Optional[int] = None
+        self.name = name
+        self.route = route
+        self.created_at = datetime.utcnow().isoformat()
+        self.duration = 0.0
+        self.stats: Dict = {}
+        self.worker_stats: List[Dict] = []
+
+    def summary(self) -> Dict:
+        return {
+            'id': self.id,
+            'name': self.name,
+            'route': self.route,
+            'created_at': self.created_at,
+            'duration': self.duration,
+            'worker_profiles': len(self.worker_stats),
+        }
+
+class ProfileStore:
+    """The `keep` slowest request profiles, held in a min-heap on duration"""
+
+    def __init__(self, keep: int):
+        self.keep = max(1, keep)
+        self._heap: List[tuple] = []  # (duration, id, profile)
+        self._next_id = 1
+
+    def add(self, profile: RequestProfile):
+        profile.id = self._next_id
+        self._next_id += 1
+        entry = (profile.duration, profile.id, profile)
+        if len(self._heap) < self.keep:
+            heapq.heappush(self._heap, entry)
+        elif entry[0] > self._heap[0][0]:
+            heapq.heapreplace(self._heap, entry)
+
+    def list(self) -> List[Dict]:
+        return [profile.summary() for _, _, profile in sorted(self._heap, reverse=True)]
+
+    def get(self, profile_id: int) -> Optional[RequestProfile]:
+        for _, _, profile in self._heap:
+            if profile.id == profile_id:
+                return profile
+        return None
+
+profile_store = ProfileStore(PROFILE_KEEP)
+_active_profile: ContextVar[Optional[RequestProfile]] = ContextVar('active_profile', default=None)
+_loop_profiler_busy = False  # one cProfile at a time on the event loop thread
+
+def start_profiler() -> Optional[cProfile.Profile]:
+    """An enabled profiler, or None if another profiler already holds this thread"""
+    profiler = cProfile.Profile()
     try:
-        plan = await db.study_plans.find_one({'_id': ObjectId(plan_id)})
-        if not plan:
-            raise HTTPException(status_code=404, detail="Study plan not found")
-        
-        # Update session completion status
-        for session in plan['sessions']:
-            if (session['date'] == update_data.date and 
-                session['subject'] == update_data.subject and 
-                session['topic'] == update_data.topic):
-                session['completed'] = update_data.completed
-        
-        # Update in database
-        await db.study_plans.update_one(
-            {'_id': ObjectId(plan_id)},
-            {'$set': {'sessions': plan['sessions']}}
+        profiler.enable()
+    except ValueError:
+        return None
+    return profiler
+
+def stop_profiler(profiler: cProfile.Profile) -> Dict:
+    profiler.disable()
+    profiler.create_stats()
+    return profiler.stats
+
+def should_profile() -> bool:
+    scope = _metrics_scope.get()
+    if scope is not None:
+        for name, value in scope.get('headers', ()):
+            if name == PROFILE_HEADER:
+                return value.strip().lower() in (b'1', b'true', b'yes')
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+def profiled(name: str):
+    """
+    Profile an async handler when the request opts in. cProfile sees the
+    whole event loop thread, so other requests running while this one
+    awaits also show up in its profile.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            global _loop_profiler_busy
+            if _loop_profiler_busy or not should_profile():
+                return await func(*args, **kwargs)
+            profiler = start_profiler()
+            if profiler is None:
+                return await func(*args, **kwargs)
+
+            _loop_profiler_busy = True
+            profile = RequestProfile(name, current_route())
+            token = _active_profile.set(profile)
+            started = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                profile.stats = stop_profiler(profiler)
+                profile.duration = time.perf_counter() - started
+                _active_profile.reset(token)
+                _loop_profiler_busy = False
+                profile_store.add(profile)
+        return wrapper
+    return decorator
+
+class _RawStats:
+    """Lets pstats.Stats load an already collected stats dict"""
+
+    def __init__(self, stats: Dict):
+        self.stats = dict(stats)
+
+    def create_stats(self):
+        pass
+
+def merged_pstats(profile: RequestProfile) -> Dict:
+    """Handler and worker stats combined, as dumped by pstats.Stats.dump_stats"""
+    stats = pstats.Stats(_RawStats(profile.stats))
+    for worker_stats in profile.worker_stats:
+        stats.add(_RawStats(worker_stats))
+    return stats.stats
+
+def speedscope_samples(stats: Dict, frames: List[Dict], frame_index: Dict) -> tuple:
+    """
+    Approximate call stacks from cProfile's caller graph. Each caller edge
+    records the callee's time when called from that caller; a stack's share
+    of it follows the caller's share of cumulative time on that stack, as in
+    gprof. Recursive edges are cut, and stacks weighing less than
+    SPEEDSCOPE_MIN_FRACTION of the total are dropped.
+    """
+    def frame(func) -> int:
+        index = frame_index.get(func)
+        if index is None:
+            filename, line, func_name = func
+            index = frame_index[func] = len(frames)
+            frames.append({'name': func_name, 'file': filename, 'line': line})
+        return index
+
+    callees: Dict[tuple, List[tuple]] = {}
+    for func, (_, _, _, _, callers) in stats.items():
+        for caller, edge in callers.items():
+            callees.setdefault(caller, []).append((func, edge[3]))
+
+    total = sum(entry[2] for entry in stats.values())
+    min_weight = total * SPEEDSCOPE_MIN_FRACTION
+    samples, weights = [], []
+    # (function, stack of frame indexes, cumulative time on this stack)
+    pending = [(func, [frame(func)], entry[3]) for func, entry in stats.items() if not entry[4]]
+    while pending:
+        func, stack, stack_time = pending.pop()
+        _, _, own_time, cumulative, _ = stats[func]
+        share = stack_time / cumulative if cumulative else 0.0
+        if own_time * share >= min_weight:
+            samples.append(stack)
+            weights.append(own_time * share)
+        if len(stack) >= SPEEDSCOPE_MAX_DEPTH:
+            continue
+        for callee, edge_time in callees.get(func, ()):
+            callee_time = edge_time * share
+            if callee_time < min_weight or callee not in stats:
+                continue
+            callee_frame = frame(callee)
+            if callee_frame in stack:
+                continue
+            pending.append((callee, stack + [callee_frame], callee_time))
+    return samples, weights
+
+def speedscope_document(profile: RequestProfile) -> Dict:
+    """The handler and each worker profile as sampled profiles in one speedscope file"""
+    frames: List[Dict] = []
+    frame_index: Dict = {}
+    parts = [(profile.name, profile.stats)]
+    parts += [(f"{profile.name} worker {n}", stats) for n, stats in enumerate(profile.worker_stats, 1)]
+    profiles = []
+    for name, stats in parts:
+        samples, weights = speedscope_samples(stats, frames, frame_index)
+        profiles.append({
+            'type': 'sampled',
+            'name': name,
+            'unit': 'seconds',
+            'startValue': 0,
+            'endValue': sum(weights),
+            'samples': samples,
+            'weights': weights,
+        })
+    return {
+        '$schema': 'https://www.speedscope.app/file-format-schema.json',
+        'name': f"{profile.name} #{profile.id} ({profile.route})",
+        'exporter': 'study-planner',
+        'activeProfileIndex': 0,
+        'shared': {'frames': frames},
+        'profiles': profiles,
+    }
+
+# Schedule generation executor
+# Generation is CPU-bound, so it runs off the event loop in a worker pool.
+# Requests beyond pool size + queue depth are rejected instead of piling up.
+SCHEDULER_EXECUTOR = os.environ.get('SCHEDULER_EXECUTOR', 'process')  # 'process' or 'thread'
+SCHEDULER_POOL_SIZE = int(os.environ.get('SCHEDULER_POOL_SIZE', os.cpu_count() or 1))
+SCHEDULER_MAX_QUEUE = int(os.environ.get('SCHEDULER_MAX_QUEUE', '32'))
+
+class SchedulerBusyError(Exception):
+    """Raised when every worker is busy and the wait queue is full"""
+
+def _timed_generate(
+    subjects: List[Subject],
+    daily_hours: float,
+    start_date: str,
+    calendar: Optional[DayCalendar] = None,
+    first_seq: int = 0,
+    strategy: str = 'greedy',
+    profile: bool = False,
+):
+    """Worker entry point: generate session dicts, report when it ran and optionally its profile"""
+    started_at = time.time()
+    profiler = start_profiler() if profile else None
+    columns = SCHEDULING_STRATEGIES[strategy](subjects, daily_hours, start_date, calendar)
+    sessions = columns.to_dicts(first_seq)
+    stats = stop_profiler(profiler) if profiler is not None else None
+    return sessions, started_at, time.time(), stats
+
+class ScheduleExecutor:
+    """Bounded worker pool for generate_study_schedule with wait/compute stats"""
+
+    def __init__(self, kind: str, pool_size: int, max_queue: int):
+        if kind not in ('process', 'thread'):
+            raise ValueError(f"Unknown scheduler executor: {kind}")
+        self.kind = kind
+        self.pool_size = max(1, pool_size)
+        self.max_queue = max(0, max_queue)
+        self.in_flight = 0
+        self._pool = None
+        self._stats = {
+            'completed': 0,
+            'rejected': 0,
+            'failed': 0,
+            'pool_restarts': 0,
+            'queue_wait_total': 0.0,
+            'queue_wait_max': 0.0,
+            'compute_total': 0.0,
+            'compute_max': 0.0,
+        }
+
+    def _get_pool(self):
+        if self._pool is None:
+            if self.kind == 'process':
+                # spawn keeps workers clear of the Motor client's threads
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.pool_size,
+                    mp_context=multiprocessing.get_context('spawn'),
+                )
+            else:
+                self._pool = ThreadPoolExecutor(
+                    max_workers=self.pool_size,
+                    thread_name_prefix='scheduler',
+                )
+        return self._pool
+
+    async def generate(
+        self,
+        subjects: List[Subject],
+        daily_hours: float,
+        start_date: str,
+        calendar: Optional[DayCalendar] = None,
+        first_seq: int = 0,
+        strategy: str = 'greedy',
+    ) -> List[Dict]:
+        if self.in_flight >= self.pool_size + self.max_queue:
+            self._stats['rejected'] += 1
+            raise SchedulerBusyError("Schedule generation pool is saturated")
+
+        self.in_flight += 1
+        submitted_at = time.time()
+        profile = _active_profile.get()
+        pool = self._get_pool()
+        try:
+            loop = asyncio.get_running_loop()
+            sessions, started_at, finished_at, worker_stats = await loop.run_in_executor(
+                pool, _timed_generate,
+                subjects, daily_hours, start_date, calendar, first_seq, strategy, profile is not None,
+            )
+        except BrokenProcessPool:
+            # A worker died (OOM kill, crash): the pool never recovers, so
+            # drop it and let the next call start a fresh one
+            self._stats['failed'] += 1
+            self._stats['pool_restarts'] += 1
+            if self._pool is pool:
+                self._pool = None
+                pool.shutdown(wait=False, cancel_futures=True)
+            raise
+        except Exception:
+            self._stats['failed'] += 1
+            raise
+        finally:
+            self.in_flight -= 1
+
+        queue_wait = max(0.0, started_at - submitted_at)
+        compute = finished_at - started_at
+        observe_phase('queue_wait', queue_wait)
+        observe_phase('generate', compute)
+        if worker_stats is not None:
+            profile.worker_stats.append(worker_stats)
+        self._stats['completed'] += 1
+        self._stats['queue_wait_total'] += queue_wait
+        self._stats['queue_wait_max'] = max(self._stats['queue_wait_max'], queue_wait)
+        self._stats['compute_total'] += compute
+        self._stats['compute_max'] = max(self._stats['compute_max'], compute)
+        return sessions
+
+    def stats(self) -> Dict:
+        completed = self._stats['completed']
+        return {
+            'executor': self.kind,
+            'pool_size': self.pool_size,
+            'max_queue': self.max_queue,
+            'in_flight': self.in_flight,
+            **self._stats,
+            'queue_wait_avg': self._stats['queue_wait_total'] / completed if completed else 0.0,
+            'compute_avg': self._stats['compute_total'] / completed if completed else 0.0,
+        }
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+schedule_executor = ScheduleExecutor(SCHEDULER_EXECUTOR, SCHEDULER_POOL_SIZE, SCHEDULER_MAX_QUEUE)
+
+# Generated schedule cache
+# generate_study_schedule is a pure function of its inputs, so identical plan
+# requests (e.g. one class template reused by many students) share a result.
+# Entries live in an in-process LRU with a TTL, optionally backed by a
+# persistent tier ('mongo' or 'disk') that survives worker restarts.
+SCHEDULE_CACHE_SIZE = int(os.environ.get('SCHEDULE_CACHE_SIZE', '256'))  # 0 disables the cache
+SCHEDULE_CACHE_TTL = float(os.environ.get('SCHEDULE_CACHE_TTL_SECONDS', '86400'))
+SCHEDULE_CACHE_PERSIST = os.environ.get('SCHEDULE_CACHE_PERSIST', '')  # '', 'mongo' or 'disk'
+SCHEDULE_CACHE_DIR = Path(os.environ.get('SCHEDULE_CACHE_DIR', str(ROOT_DIR / '.schedule_cache')))
+
+def schedule_cache_key(subjects: List[Subject], daily_hours: float, start_date: str, strategy: str = 'greedy') -> str:
+    """Hash of the normalized scheduler input; presentation fields are left out"""
+    payload = {
+        'subjects': [
+            {
+                'name': subject.name,
+                'exam_date': subject.exam_date,
+                'topics': [
+                    [topic.name, topic.difficulty, float(topic.hours_needed)]
+                    for topic in subject.topics
+                ],
+            }
+            for subject in subjects
+        ],
+        'daily_hours': float(daily_hours),
+        'start_date': start_date,
+        'strategy': strategy,
+    }
+    canonical = json.dumps(payload, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+class MongoScheduleStore:
+    """Persistent cache tier in the schedule_cache collection (TTL-indexed)"""
+    name = 'mongo'
+
+    async def load(self, key: str, ttl: float) -> Optional[List[Dict]]:
+        entry = await db.schedule_cache.find_one({'_id': key, 'expires_at': {'$gt': datetime.utcnow()}})
+        return entry['sessions'] if entry else None
+
+    async def save(self, key: str, sessions: List[Dict], ttl: float):
+        await db.schedule_cache.replace_one(
+            {'_id': key},
+            {'sessions': sessions, 'expires_at': datetime.utcnow() + timedelta(seconds=ttl)},
+            upsert=True,
         )
-        
-        plan['id'] = str(plan['_id'])
-        del plan['_id']
-        return plan
-    except HTTPException:
-        raise  # Re-raise HTTPExceptions as-is
-    except Exception as e:
-        logging.error(f"Error updating session: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e))
 
-@api_router.delete("/study-plans/{plan_id}")
-async def delete_study_plan(plan_id: str):
-    try:
-        result = await db.study_plans.delete_one({'_id': ObjectId(plan_id)})
-        if result.deleted_count == 0:
-            raise HTTPException(status_code=404, detail="Study plan not found")
-        return {"message": "Study plan deleted successfully"}
-    except HTTPException:
-        raise  # Re-raise HTTPExceptions as-is
-    except Exception as e:
-        logging.error(f"Error deleting study plan: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e))
+class DiskScheduleStore:
+    """Persistent cache tier with one JSON file per entry"""
+    name = 'disk'
 
-# Include the router in the main app
-app.include_router(api_router)
+    def __init__(self, directory: Path):
+        self.directory = directory
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_credentials=True,
-    allow_origins=["*"],
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+    def _load(self, key: str, ttl: float) -> Optional[List[Dict]]:
+        path = self.directory / f"{key}.json"
+        try:
+            if time.time() - path.stat().st_mtime > ttl:
+                path.unlink(missing_ok=True)
+                return None
+            return json.loads(path.read_text())
+        except FileNotFoundError:
+            return None
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
-logger = logging.getLogger(__name__)
+    def _save(self, key: str, sessions: List[Dict]):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.directory / f"{key}.{os.getpid()}.tmp"
+        tmp_path.write_text(json.dumps(sessions))
+        tmp_path.replace(self.directory / f"{key}.json")
 
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
+    async def load(self, key: str, ttl: float) -> Optional[List[Dict]]:
+        return await asyncio.to_thread(self._load, key, ttl)
+
+    async def save(self, key: str, sessions: List[Dict], ttl: float):
+        await asyncio.to_thread(self._save, key, sessions)
+
+class ScheduleCache:
+    """LRU + TTL cache of generated sessions with an optional persistent tier"""
+
+    def __init__(self, max_size: int, ttl: float, store=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.store = store
+        self._entries: OrderedDict = OrderedDict()  # key -> (expires_at, sessions)
+        self._stats = {'hits': 0, 'persistent_hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0}
+
+    async def get(self, key: str) -> Optional[List[Dict]]:
+        if self.max_size <= 0:
+            return None
+
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, sessions = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                self._stats['hits'] += 1
+                return sessions
+            del self._entries[key]
+            self._stats['expirations'] += 1
+
+        if self.store is not None:
+            try:
+                sessions = await self.store.load(key, self.ttl)
+            except Exception as e:
+                logging.warning(f"Schedule cache store read failed: {str(e)}")
+                sessions = None
+            if sessions is not None:
+                self._remember(key, sessions)
+                self._stats['persistent_hits'] += 1
+                return sessions
+
+        self._stats['misses'] += 1
+        return None
+
+    async def put(self, key: str, sessions: List[Dict]):
+        if self.max_size <= 0:
+            return
+        self._remember(key, sessions)
+        if self.store is not None:
+            try:
+                await self.store.save(key, sessions, self.ttl)
+            except Exception as e:
+                logging.warning(f"Schedule cache store write failed: {str(e)}")
+
+    def _remember(self, key: str, sessions: List[Dict]):
+        self._entries[key] = (time.monotonic() + self.ttl, sessions)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self._stats['evictions'] += 1
+
+    def stats(self) -> Dict:
+        return {
+            'size': len(self._entries),
+            'max_size': self.max_size,
+            'ttl_seconds': self.ttl,
+            'persistent_tier': self.store.name if self.store else None,
+            **self._stats,
+        }
+
+def make_schedule_store():
+    if SCHEDULE_CACHE_PERSIST == 'mongo':
+        return MongoScheduleStore()
+    if SCHEDULE_CACHE_PERSIST == 'disk':
+        return DiskScheduleStore(SCHEDULE_CACHE_DIR)
+    return None
+
+schedule_cache = ScheduleCache(SCHEDULE_CACHE_SIZE, SCHEDULE_CACHE_TTL, make_schedule_store())
+
+async def build_schedule(
+    subjects: List[Subject],
+    daily_hours: float,
+    start_date: str,
+    strategy: str = 'greedy',
+) -> List[Dict]:
+    """Cached schedule for the input, generating it in the worker pool on a miss"""
+    key = schedule_cache_key(subjects, daily_hours, start_date, strategy)
+    sessions = await schedule_cache.get(key)
+    if sessions is None:
+        sessions = await schedule_executor.generate(subjects, daily_hours, start_date, strategy=strategy)
+        await schedule_cache.put(key, sessions)
+    return sessions
+
+# Session storage
+# Sessions are embedded in the plan document by default. With
+# SESSION_STORAGE=collection (or 'auto' for plans at or above
+# SESSION_COLLECTION_THRESHOLD sessions) they live in study_sessions instead,
+# one document per session keyed by plan_id. Such plans are flagged with
+# session_storage='collection' and keep session/completed counts.
+SESSION_STORAGE = os.environ.get('SESSION_STORAGE', 'embedded')  # 'embedded', 'collection' or 'auto'
+SESSION_COLLECTION_THRESHOLD = int(os.environ.get('SESSION_COLLECTION_THRESHOLD', '2000'))
+
+# Bookkeeping fields of collection-mode plans, hidden from API responses
+SESSION_STORAGE_FIELDS = ('session_storage', 'session_count', 'completed_count')
+
+# Matches plans with embedded sessions, including plans older than the flag
+EMBEDDED_SESSIONS = {'session_storage': {'$ne': 'collection'}}
+
+def uses_session_collection(session_count: int) -> bool:
+    if SESSION_STORAGE == 'collection':
+        return True
+    if SESSION_STORAGE == 'auto':
+        return session_count >= SESSION_COLLECTION_THRESHOLD
+    return False
+
+async def insert_plan_sessions(plan_oid: ObjectId, sessions: List[Dict]):
+    if sessions:
+        await db.study_sessions.insert_many(
+            [{**session, 'plan_id': plan_oid} for session in sessions],
+            ordered=False,
+        )
+
+async def insert_plan(plan_dict: Dict) -> ObjectId:
+    """Insert a plan using the session layout chosen for its size"""
+    sessions = plan_dict.get('sessions') or []
+    if not uses_session_collection(len(sessions)):
+        result = await db.study_plans.insert_one(plan_dict)
+        return result.inserted_id
+
+    plan_doc = {key: value for key, value in plan_dict.items() if key != 'sessions'}
+    plan_doc.update(
+        session_storage='collection',
+        session_count=len(sessions),
+        completed_count=sum(1 for session in sessions if session.get('completed')),
+    )
+    result = await db.study_plans.insert_one(plan_doc)
+    try:
+        await insert_plan_sessions(result.inserted_id, sessions)
+    except Exception:
+        # Don't leave a plan behind without its sessions
+        await db.study_plans.delete_one({'_id': result.inserted_id})
+        await db.study_sessions.delete_many({'plan_id': result.inserted_id})
+        raise
+    return result.inserted_id
+
+async def insert_plans(plan_dicts: List[Dict]) -> List[Optional[str]]:
+    """
+    Insert many plans, embedded ones with a single unordered insert_many.
+    Sets `_id` on each stored dict and returns an error message per plan
+    (None where the insert succeeded).
+    """
+    errors: List[Optional[str]] = [None] * len(plan_dicts)
+    embedded = []
+    for index, plan_dict in enumerate(plan_dicts):
+        if uses_session_collection(len(plan_dict.get('sessions') or [])):
+            try:
+                plan_dict['_id'] = await insert_plan(plan_dict)
+            except Exception as e:
+                errors[index] = str(e)
+        else:
+            embedded.append(index)
+
+    if embedded:
+        try:
+            await db.study_plans.insert_many([plan_dicts[index] for index in embedded], ordered=False)
+        except BulkWriteError as e:
+            for error in e.details.get('writeErrors', []):
+                errors[embedded[error['index']]] = error.get('errmsg', 'Insert failed')
+    return errors
+
+async def find_sessions(
+    plan_oid: ObjectId,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    filters: Optional[Dict] = None,
+    database=None,
+) -> List[Dict]:
+    """Sessions of a collection-mode plan in schedule order, optionally within a date window"""
+    query = {'plan_id': plan_oid, **(filters or {})}
+    date_range = {}
+    if date_from:
+        date_range['$gte'] = date_from
+    if date_to:
+        date_range['$lte'] = date_to
+    if date_range:
+        query['date'] = date_range
+    cursor = (database or db).study_sessions.find(query, {'_id': 0, 'plan_id': 0})
+    return await cursor.sort([('date', ASCENDING), ('start_time', ASCENDING), ('_id', ASCENDING)]).to_list(None)
+
+async def attach_sessions(plan: Dict, database=None) -> Dict:
+    """Give a plan document its sessions array whichever layout it uses"""
+    if plan.get('session_storage') == 'collection':
+        plan['sessions'] = await find_sessions(plan['_id'], database=database)
+    for field in SESSION_STORAGE_FIELDS:
+        plan.pop(field, None)
+    return plan
+
+# Plan summaries
+# Each plan stores per-day and per-subject counters under `summary` so the
+# agenda and progress reads never scan the sessions. Subjects are keyed by
+# their index in `subjects`, since names may contain '.' or '$'. Completion
+# writes $inc the counters in the same version-guarded update that flips
+# the sessions; plans without a summary get one built on first read.
+SUMMARY_WRITE_ATTEMPTS = 5
+
+def empty_totals() -> Dict:
+    return {'sessions': 0, 'hours': 0.0, 'completed': 0, 'completed_hours': 0.0}
+
+def build_plan_summary(subjects: List[Dict], sessions: List[Dict]) -> Dict:
+    """Per-day and per-subject session and hour totals of a plan"""
+    subject_keys: Dict[str, str] = {}
+    subject_totals = {}
+    for index, subject in enumerate(subjects):
+        key = subject_keys.setdefault(subject['name'], str(index))
+        if key == str(index):
+            subject_totals[key] = {'name': subject['name'], 'exam_date': subject['exam_date'], **empty_totals()}
+
+    days: Dict[str, Dict] = {}
+    for session in sessions:
+        duration = session['duration']
+        completed = bool(session.get('completed'))
+        totals = [days.setdefault(session['date'], empty_totals())]
+        key = subject_keys.get(session['subject'])
+        if key is not None:
+            totals.append(subject_totals[key])
+        for entry in totals:
+            entry['sessions'] += 1
+            entry['hours'] += duration
+            if completed:
+                entry['completed'] += 1
+                entry['completed_hours'] += duration
+    return {'days': days, 'subjects': subject_totals}
+
+def summary_increments(subjects: List[Dict], changed: List[tuple]) -> Dict:
+    """$inc document moving the summary counters for (session, completed) changes"""
+    subject_keys: Dict[str, str] = {}
+    for index, subject in enumerate(subjects):
+        subject_keys.setdefault(subject['name'], str(index))
+    increments: Dict[str, float] = {}
+    for session, completed in changed:
+        sign = 1 if completed else -1
+        prefixes = [f"summary.days.{session['date']}"]
+        key = subject_keys.get(session['subject'])
+        if key is not None:
+            prefixes.append(f"summary.subjects.{key}")
+        for prefix in prefixes:
+            increments[f"{prefix}.completed"] = increments.get(f"{prefix}.completed", 0) + sign
+            increments[f"{prefix}.completed_hours"] = (
+                increments.get(f"{prefix}.completed_hours", 0.0) + sign * session['duration']
+            )
+    return increments
+
+def session_condition(query: Dict) -> Dict:
+    """Aggregation expression testing $$session against a session query"""
+    terms = []
+    for field, value in query.items():
+        if isinstance(value, dict) and '$in' in value:
+            terms.append({'$in': [f'$$session.{field}', value['$in']]})
+        else:
+            terms.append({'$eq': [f'$$session.{field}', value]})
+    return {'$and': terms}
+
+def session_matches(session: Dict, query: Dict) -> bool:
+    for field, value in query.items():
+        if isinstance(value, dict) and '$in' in value:
+            if session.get(field) not in value['$in']:
+                return False
+        elif session.get(field) != value:
+            return False
+    return True
+
+def version_guard(version: Optional[int]) -> Dict:
+    """Filter matching a plan still at `version` (plans predating versions have none)"""
+    return {'version': version} if version is not None else {'version': {'$exists': False}}
+
+async def store_plan_summary(plan_oid: ObjectId, version: Optional[int], summary: Dict) -> bool:
+    """Save a freshly built summary unless the plan was written since `version`"""
+    result = await db.study_plans.update_one(
+        {'_id': plan_oid, **version_guard(version)},
+        {'$set': {'summary': summary}},
+    )
+    if result.matched_count:
+        return True
+    # Lost a race with another write: leave it to the next read to rebuild
+    await db.study_plans.update_one({'_id': plan_oid}, {'$unset': {'summary': ''}})
+    return False
+
+async def apply_session_completion(plan_oid: ObjectId, changes: List[tuple], return_plan: bool = False):
+    """
+    Set completion on the sessions matched by each (query, completed) pair,
+    where queries use session field names and later pairs win. Returns None
+    when the plan does not exist, otherwise whether any session changed, or
+    with `return_plan` the plan as written (sessions attached, no summary).
+
+    This is a read and a write rather than one blind update: the matching
+    sessions are read first so the plan summary can be moved by exactly
+    their hours, and the write, which sets the flags and $incs the version
+    and summary together, only applies if the plan's version is unchanged.
+    Under contention the read and write are retried, and as a last resort
+    the flags are written unguarded and the summary dropped for a rebuild.
+    With `return_plan` the write is a find_one_and_update, so the returned
+    plan is exactly the one the write produced.
+    """
+    if not changes:
+        if return_plan:
+            return await completion_plan_document(plan_oid)
+        exists = await db.study_plans.count_documents({'_id': plan_oid}, limit=1)
+        return False if exists else None
+
+    array_filters = completion_array_filters(changes)
+
+    async def write(query: Dict, update: Dict):
+        if return_plan:
+            plan = await db.study_plans.find_one_and_update(
+                query, update,
+                array_filters=array_filters,
+                projection={'summary': 0},
+                return_document=ReturnDocument.AFTER,
+            )
+            return await attach_sessions(plan) if plan else None
+        result = await db.study_plans.update_one(query, update, array_filters=array_filters)
+        return result.matched_count > 0
+
+    pipeline = [
+        {'$match': {'_id': plan_oid}},
+        {'$project': {
+            'version': 1,
+            'session_storage': 1,
+            'subjects.name': 1,
+            'has_summary': {'$ne': [{'$ifNull': ['$summary', None]}, None]},
+            'sessions': {'$filter': {
+                'input': {'$ifNull': ['$sessions', []]},
+                'as': 'session',
+                'cond': {'$or': [session_condition(query) for query, _ in changes]},
+            }},
+        }},
+    ]
+    for _ in range(SUMMARY_WRITE_ATTEMPTS):
+        plans = await db.study_plans.aggregate(pipeline).to_list(1)
+        if not plans:
+            return None
+        plan = plans[0]
+        if plan.get('session_storage') == 'collection':
+            changed = await apply_collection_completion(plan, changes)
+            return await completion_plan_document(plan_oid) if return_plan else changed
+
+        changed = session_changes(plan['sessions'], changes)
+        if not changed:
+            return await completion_plan_document(plan_oid) if return_plan else False
+        written = await write(
+            {'_id': plan_oid, **version_guard(plan.get('version'))},
+            embedded_completion_update(plan, changes, changed),
+        )
+        if written:
+            return written
+
+    # Still contended: write without the guard and let the summary be rebuilt
+    return await write(
+        {'_id': plan_oid},
+        {'$set': completion_sets(changes), '$inc': {'version': 1}, '$unset': {'summary': ''}},
+    )
+
+async def known_session_ids(plan_oid: ObjectId, session_ids: List[str]) -> Optional[set]:
+    """Which of `session_ids` the plan has, or None when the plan does not exist"""
+    plan = await db.study_plans.find_one({'_id': plan_oid}, {'session_storage': 1, 'sessions.id': 1})
+    if not plan:
+        return None
+    if plan.get('session_storage') == 'collection':
+        sessions = await db.study_sessions.find(
+            {'plan_id': plan_oid, 'id': {'$in': session_ids}}, {'_id': 0, 'id': 1}
+        ).to_list(None)
+    else:
+        sessions = plan.get('sessions') or []
+    wanted = set(session_ids)
+    return {session['id'] for session in sessions if session.get('id') in wanted}
+
+async def completion_plan_document(plan_oid: ObjectId) -> Optional[Dict]:
+    plan = await db.study_plans.find_one({'_id': plan_oid}, {'summary': 0})
+    return await attach_sessions(plan) if plan else None
+
+def session_changes(sessions: List[Dict], changes: List[tuple]) -> List[tuple]:
+    """(session, completed) for each session whose completion would change"""
+    changed = []
+    for session in sessions:
+        target = None
+        for query, completed in changes:
+            if session_matches(session, query):
+                target = completed
+        if target is not None and bool(session.get('completed')) != target:
+            changed.append((session, target))
+    return changed
+
+def completion_sets(changes: List[tuple]) -> Dict:
+    return {f'sessions.$[m{index}].completed': completed for index, (_, completed) in enumerate(changes)}
+
+def completion_array_filters(changes: List[tuple]) -> List[Dict]:
+    return [
+        {f'm{index}.{field}': value for field, value in query.items()}
+        for index, (query, _) in enumerate(changes)
+    ]
+
+def embedded_completion_update(plan: Dict, changes: List[tuple], changed: List[tuple]) -> Dict:
+    increments = {'version': 1}
+    if plan.get('has_summary'):
+        increments.update(summary_increments(plan.get('subjects') or [], changed))
+    return {'$set': completion_sets(changes), '$inc': increments}
+
+async def apply_collection_completion(plan: Dict, changes: List[tuple]) -> bool:
+    """Completion changes for a plan whose sessions live in study_sessions"""
+    plan_oid = plan['_id']
+    sessions = await db.study_sessions.find(
+        {'plan_id': plan_oid, '$or': [query for query, _ in changes]},
+        {'date': 1, 'subject': 1, 'duration': 1, 'completed': 1, **{
+            field: 1 for query, _ in changes for field in query
+        }},
+    ).to_list(None)
+    changed = session_changes(sessions, changes)
+    if not changed:
+        return False
+
+    delta = 0
+    for completed in (True, False):
+        ids = [session['_id'] for session, target in changed if target == completed]
+        if ids:
+            result = await db.study_sessions.update_many(
+                {'_id': {'$in': ids}, 'completed': {'$ne': completed}},
+                {'$set': {'completed': completed}},
+            )
+            delta += result.modified_count if completed else -result.modified_count
+
+    update = {'$inc': {'completed_count': delta, 'version': 1}}
+    expected = sum(1 if completed else -1 for _, completed in changed)
+    if delta == expected and plan.get('has_summary'):
+        update['$inc'].update(summary_increments(plan.get('subjects') or [], changed))
+    elif plan.get('has_summary'):
+        # Another writer flipped some of these first; rebuild the summary lazily
+        update['$unset'] = {'summary': ''}
+    await db.study_plans.update_one({'_id': plan_oid}, update)
+    return True
+
+async def migrate_plan_sessions(plan: Dict) -> bool:
+    """
+    Move one embedded plan's sessions into study_sessions. Completion changes
+    made while a plan is being moved can be lost, so run this off-peak.
+    """
+    sessions = plan.get('sessions') or []
+    for seq, session in enumerate(sessions):
+        # Plans created before session IDs get them now
+        if not session.get('id'):
+            session['id'] = session_id(seq)
+
+    # Clear leftovers from an interrupted run before copying
+    await db.study_sessions.delete_many({'plan_id': plan['_id']})
+    await insert_plan_sessions(plan['_id'], sessions)
+    result = await db.study_plans.update_one(
+        {'_id': plan['_id'], **EMBEDDED_SESSIONS},
+        {
+            '$unset': {'sessions': ''},
+            '$set': {
+                'session_storage': 'collection',
+                'session_count': len(sessions),
+                'completed_count': sum(1 for session in sessions if session.get('completed')),
+            },
+            '$inc': {'version': 1},
+        },
+    )
+    if result.modified_count == 0:
+        await db.study_sessions.delete_many({'plan_id': plan['_id']})
+        return False
+    return True
+
+async def migrate_embedded_plans(min_sessions: int = 0, limit: int = 0) -> int:
+    """Migrate embedded plans with at least `min_sessions` sessions"""
+    query = dict(EMBEDDED_SESSIONS)
+    if min_sessions > 0:
+        query[f'sessions.{min_sessions - 1}'] = {'$exists': True}
+    cursor = db.study_plans.find(query)
+    if limit:
+        cursor = cursor.limit(limit)
+
+    migrated = 0
+    async for plan in cursor:
+        if await migrate_plan_sessions(plan):
+            migrated += 1
+    return migrated
+
+# API Routes
+@api_router.get("/")
+async def root():
+    return {"message": "Study Scheduler API"}
+
+def new_plan_document(plan_data: StudyPlanCreate, start_date: str, sessions: List[Dict]) -> Dict:
+    """Plan document for storage; sessions are already validated scheduler output"""
+    plan_dict = {
+        'subjects': [subject.dict() for subject in plan_data.subjects],
+        'daily_hours': plan_data.daily_hours,
+        'start_date': start_date,
+        'sessions': sessions,
+        'created_at': datetime.utcnow().isoformat(),
+        'strategy': plan_data.strategy,
+        'version': 1,
+        'summary': build_plan_summary([subject.dict() for subject in plan_data.subjects], sessions),
+    }
+    if plan_data.student_id is not None:
+        plan_dict['student_id'] = plan_data.student_id
+    return plan_dict
+
+async def create_plan_document(plan_data: StudyPlanCreate, plan_oid: Optional[ObjectId] = None) -> Dict:
+    """Generate (or reuse) the schedule and store the plan, returning the stored dict"""
+    start_date = plan_data.start_date or datetime.utcnow().date().isoformat()
+
+    # Generate schedule off the event loop, or reuse an identical one
+    sessions = await build_schedule(
+        plan_data.subjects,
+        plan_data.daily_hours,
+        start_date,
+        plan_data.strategy
+    )
+
+    plan_dict = new_plan_document(plan_data, start_date, sessions)
+    if plan_oid is not None:
+        plan_dict['_id'] = plan_oid
+    plan_dict['_id'] = await insert_plan(plan_dict)
+    return plan_dict
+
+@api_router.post("/study-plans", response_model=StudyPlan)
+@profiled('create_study_plan')
+async def create_study_plan(plan_data: StudyPlanCreate, run_async: bool = Query(False, alias='async')):
+    """
+    Create a plan and return it. With `async=true` the plan is created by a
+    background job instead: the response is 202 with the job, to be polled
+    at GET /api/jobs/{id}.
+    """
+    observe_parse()
+    try:
+        if run_async:
+            # Pin the start date now so a requeued job builds the same plan
+            if plan_data.start_date is None:
+                plan_data = plan_data.copy(update={'start_date': datetime.utcnow().date().isoformat()})
+            job = await enqueue_plan_job(plan_data)
+            location = f"/api/jobs/{job['_id']}"
+            return FastJSONResponse(public_job(job), status_code=202, headers={'Location': location})
+
+        plan_dict = await create_plan_document(plan_data)
+        plan_dict['id'] = str(plan_dict.pop('_id'))
+        plan_dict.pop('summary', None)
+        return FastJSONResponse(plan_dict)
+    except SchedulerBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={'Retry-After': '1'})
+    except InfeasiblePlanError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except Exception as e:
+        logging.error(f"Error creating study plan: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@api_router.post("/study-plans/simulate", response_model=Dict)
+async def simulate_study_plans(request: SimulationRequest):
+    """
+    What-if capacity check for every combination of `daily_hours` and
+    `start_dates`. Nothing is scheduled or stored; see simulate_capacity for
+    what each scenario reports.
+    """
+    observe_parse()
+    try:
+        start_dates = request.start_dates or [datetime.utcnow().date().isoformat()]
+        if not request.daily_hours:
+            raise HTTPException(status_code=400, detail="daily_hours must not be empty")
+        if any(hours <= 0 for hours in request.daily_hours):
+            raise HTTPException(status_code=400, detail="daily_hours must be positive")
+        if len(request.daily_hours) * len(start_dates) > SIMULATION_MAX_SCENARIOS:
+            raise HTTPException(status_code=400, detail=f"Grid exceeds {SIMULATION_MAX_SCENARIOS} scenarios")
+        for value in start_dates + [subject.exam_date for subject in request.subjects]:
+            try:
+                datetime.fromisoformat(value)
+            except ValueError:
+                raise HTTPException(status_code=400, detail=f"Invalid date: {value}")
+
+        started = time.perf_counter()
+        grid = simulate_capacity(request.subjects, request.daily_hours, start_dates)
+        # Plain lists: indexing NumPy arrays per scenario costs more than the math
+        effective = grid['effective_hours'].tolist()
+        required = [finite_or_none(value) for value in grid['required'].tolist()]
+        feasible = grid['feasible'].tolist()
+        slack = np.round(grid['slack'], 2).tolist()
+        overload_days = grid['overload_days'].tolist()
+        utilization = grid['utilization'].tolist()
+        scenarios = []
+        for h, daily_hours in enumerate(request.daily_hours):
+            for s, start_date in enumerate(start_dates):
+                scenarios.append({
+                    'daily_hours': daily_hours,
+                    'start_date': start_date,
+                    'effective_daily_hours': effective[h],
+                    'feasible': feasible[h][s],
+                    'required_daily_hours': required[s],
+                    'slack_hours': slack[h][s],
+                    'overload_days': overload_days[h][s],
+                    'utilization': finite_or_none(utilization[h][s], 4),
+                })
+        return FastJSONResponse({
+            'total_hours': round(grid['total_hours'], 2),
+            'scenarios': scenarios,
+            'elapsed_ms': round((time.perf_counter() - started) * 1000, 3),
+        })
+    except HTTPException:
+        raise  # Re-raise HTTPExceptions as-is
+    except Exception as e:
+        logging.error(f"Error simulating study plans: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Plan creation jobs
+# POST /study-plans?async=true stores a job in db.jobs and answers 202 at
+# once. JOB_CONCURRENCY workers on the event loop take job IDs off an
+# asyncio queue, claim each job atomically and create its plan, waiting out
+# a saturated scheduler pool instead of failing. Jobs still queued, or left
+# running by a worker that died, are requeued at startup. A job's plan
+# reuses the job's ObjectId, so a replayed job finds its plan rather than
+# creating a second one.
+JOB_CONCURRENCY = int(os.environ.get('JOB_CONCURRENCY', '2'))
+JOB_TTL = float(os.environ.get('JOB_TTL_SECONDS', '86400'))  # how long finished jobs are kept
+JOB_STALE_SECONDS = float(os.environ.get('JOB_STALE_SECONDS', '600'))
+JOB_BUSY_RETRY_SECONDS = 1.0
+
+class JobQueue:
+    """In-process workers for the plan creation jobs stored in db.jobs"""
+
+    def __init__(self, concurrency: int):
+        self.concurrency = max(1, concurrency)
+        self.running = 0
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._loop = None
+        self._stats = {'enqueued': 0, 'requeued': 0, 'succeeded': 0, 'failed': 0, 'busy_retries': 0}
+
+    def _start(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+        # Queue and workers belong to the loop that serves requests
+        self._loop = loop
+        self._queue = asyncio.Queue()
+        self._workers = [loop.create_task(self._work()) for _ in range(self.concurrency)]
+        self._workers.append(loop.create_task(self._sweep()))
+
+    def enqueue(self, job_id: ObjectId, requeued: bool = False):
+        self._start()
+        self._queue.put_nowait(job_id)
+        self._stats['requeued' if requeued else 'enqueued'] += 1
+
+    async def _work(self):
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run(job_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"Error running job {job_id}: {str(e)}")
+            finally:
+                self._queue.task_done()
+
+    async def _sweep(self):
+        while True:
+            await asyncio.sleep(JOB_STALE_SECONDS)
+            try:
+                await requeue_stale_jobs()
+            except Exception as e:
+                logging.error(f"Error requeueing stale jobs: {str(e)}")
+
+    async def _run(self, job_id: ObjectId):
+        job = await db.jobs.find_one_and_update(
+            {'_id': job_id, 'status': 'queued'},
+            {'$set': {'status': 'running', 'started_at': datetime.utcnow().isoformat()}, '$inc': {'attempts': 1}},
+            return_document=ReturnDocument.AFTER,
+        )
+        if job is None:
+            return  # Claimed by another worker, or gone
+
+        self.running += 1
+        try:
+            plan = await self._create_plan(job)
+        except asyncio.CancelledError:
+            # Shutting down: hand the job to the next startup
+            await db.jobs.update_one({'_id': job_id, 'status': 'running'}, {'$set': {'status': 'queued'}})
+            raise
+        except Exception as e:
+            self._stats['failed'] += 1
+            await finish_job(job_id, 'failed', {'error': str(e) or type(e).__name__})
+        else:
+            self._stats['succeeded'] += 1
+            await finish_job(job_id, 'succeeded', plan)
+        finally:
+            self.running -= 1
+
+    async def _create_plan(self, job: Dict) -> Dict:
+        plan_data = StudyPlanCreate(**job['payload'])
+        while True:
+            try:
+                plan_dict = await create_plan_document(plan_data, job['_id'])
+                return {'plan_id': str(plan_dict['_id']), 'session_count': len(plan_dict['sessions'])}
+            except DuplicateKeyError:
+                # An earlier attempt stored the plan before the job was marked done
+                return {'plan_id': str(job['_id'])}
+            except SchedulerBusyError:
+                self._stats['busy_retries'] += 1
+                await asyncio.sleep(JOB_BUSY_RETRY_SECONDS)
+
+    async def shutdown(self):
+        workers, self._workers, self._loop = self._workers, [], None
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+    def stats(self) -> Dict:
+        return {
+            'concurrency': self.concurrency,
+            'queued': self._queue.qsize() if self._queue is not None else 0,
+            'running': self.running,
+            **self._stats,
+        }
+
+job_queue = JobQueue(JOB_CONCURRENCY)
+
+async def finish_job(job_id: ObjectId, status: str, fields: Dict):
+    finished_at = datetime.utcnow()
+    update = {'$set': {
+        'status': status,
+        'finished_at': finished_at.isoformat(),
+        'expires_at': finished_at + timedelta(seconds=JOB_TTL),
+        **fields,
+    }}
+    if status == 'succeeded':
+        update['$unset'] = {'payload': ''}
+    await db.jobs.update_one({'_id': job_id}, update)
+
+async def enqueue_plan_job(plan_data: StudyPlanCreate) -> Dict:
+    job = {
+        'type': 'create_plan',
+        'status': 'queued',
+        'payload': plan_data.dict(),
+        'attempts': 0,
+        'created_at': datetime.utcnow().isoformat(),
+    }
+    result = await db.jobs.insert_one(job)
+    job_queue.enqueue(result.inserted_id)
+    return job
+
+async def requeue_stale_jobs() -> int:
+    """Queue again the jobs whose worker stopped mid-run (a crash or a lost process)"""
+    stale = {'status': 'running', 'started_at': {'$lt': (
+        datetime.utcnow() - timedelta(seconds=JOB_STALE_SECONDS)
+    ).isoformat()}}
+    requeued = 0
+    async for job in db.jobs.find(stale, {'_id': 1}):
+        result = await db.jobs.update_one({'_id': job['_id'], **stale}, {'$set': {'status': 'queued'}})
+        if result.modified_count:
+            job_queue.enqueue(job['_id'], requeued=True)
+            requeued += 1
+    return requeued
+
+def public_job(job: Dict) -> Dict:
+    job.pop('payload', None)
+    job.pop('expires_at', None)
+    return public_doc(job)
+
+@api_router.get("/jobs/{job_id}", response_model=Dict)
+async def get_job(job_id: str):
+    """Status of a plan creation job, with the plan ID once it has succeeded"""
+    try:
+        job = await db.jobs.find_one({'_id': ObjectId(job_id)}, {'payload': 0})
+        if not job:
+            raise HTTPException(status_code=404, detail="Job not found")
+        return FastJSONResponse(public_job(job))
+    except HTTPException:
+        raise  # Re-raise HTTPExceptions as-is
+    except Exception as e:
+        logging.error(f"Error fetching job: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+BATCH_MAX_PLANS = int(os.environ.get('BATCH_MAX_PLANS', '1000'))
+
+def apply_student_override(template: StudyPlanCreate, override: StudentOverride) -> StudyPlanCreate:
+    """One student's plan input: the template with their settings and topic difficulties"""
+    subjects = []
+    for subject in template.subjects:
+        difficulties = override.difficulties.get(subject.name, {})
+        topics = [
+            topic.copy(update={'difficulty': difficulties[topic.name]}) if topic.name in difficulties else topic
+            for topic in subject.topics
+        ]
+        subjects.append(subject.copy(update={'topics': topics}))
+    return StudyPlanCreate(
+        subjects=subjects,
+        daily_hours=override.daily_hours if override.daily_hours is not None else template.daily_hours,
+        start_date=override.start_date or template.start_date,
+        student_id=override.student_id if override.student_id is not None else template.student_id,
+        strategy=template.strategy,
+    )
+
+@api_router.post("/study-plans/batch", response_model=Dict)
+@profiled('create_study_plans_batch')
+async def create_study_plans_batch(batch: BatchStudyPlanCreate):
+    """
+    Create plans for a whole class from explicit payloads and/or a template
+    with per-student overrides. Schedules are generated concurrently across
+    the worker pool (identical inputs hit the schedule cache) and stored with
+    one insert_many. Each item reports its own status.
+    """
+    observe_parse()
+    try:
+        if batch.overrides and batch.template is None:
+            raise HTTPException(status_code=400, detail="overrides require a template")
+        items = list(batch.plans) + [apply_student_override(batch.template, o) for o in batch.overrides]
+        if not items:
+            raise HTTPException(status_code=400, detail="No plans in batch")
+        if len(items) > BATCH_MAX_PLANS:
+            raise HTTPException(status_code=400, detail=f"Batch exceeds {BATCH_MAX_PLANS} plans")
+
+        today = datetime.utcnow().date().isoformat()
+        # Keep at most one generation per worker in flight so the batch
+        # doesn't fill the queue that single creates rely on
+        slots = asyncio.Semaphore(schedule_executor.pool_size)
+
+        async def generate(plan_data: StudyPlanCreate) -> Dict:
+            start_date = plan_data.start_date or today
+            async with slots:
+                sessions = await build_schedule(
+                    plan_data.subjects, plan_data.daily_hours, start_date, plan_data.strategy
+                )
+            return new_plan_document(plan_data, start_date, sessions)
+
+        generated = await asyncio.gather(*(generate(item) for item in items), return_exceptions=True)
+
+        results = []
+        to_insert = []
+        for index, (item, outcome) in enumerate(zip(items, generated)):
+            result = {'index': index, 'student_id': item.student_id}
+            if isinstance(outcome, Exception):
+                result.update(status='failed', error=str(outcome) or type(outcome).__name__)
+            else:
+                result.update(status='created', session_count=len(outcome['sessions']))
+                to_insert.append((result, outcome))
+            results.append(result)
+
+        errors = await insert_plans([plan_dict for _, plan_dict in to_insert])
+        for (result, plan_dict), error in zip(to_insert, errors):
+            if error:
+                result.update(status='failed', error=error)
+                result.pop('session_count', None)
+            else:
+                result['id'] = str(plan_dict['_id'])
+
+        created = sum(1 for result in results if result['status'] == 'created')
+        return {
+            'created': created,
+            'failed': len(results) - created,
+            'results': results,
+        }
+    except HTTPException:
+        raise  # Re-raise HTTPExceptions as-is
+    except Exception as e:
+        logging.error(f"Error creating study plan batch: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Top-level plan fields that can be requested through `fields=`
+PLAN_FIELDS = {'subjects', 'daily_hours', 'start_date', 'sessions', 'created_at', 'version'}
+
+def plan_summary_projection(today: str) -> Dict:
+    """Aggregation projection that replaces plan arrays with counts"""
+    sessions = {'$ifNull': ['$sessions', []]}
+    return {
+        'created_at': 1,
+        'daily_hours': 1,
+        'start_date': 1,
+        'version': 1,
+        'subjects': {'$map': {
+            'input': {'$ifNull': ['$subjects', []]},
+            'as': 'subject',
+            'in': {
+                'name': '$$subject.name',
+                'exam_date': '$$subject.exam_date',
+                'color': '$$subject.color',
+            },
+        }},
+        'subject_count': {'$size': {'$ifNull': ['$subjects', []]}},
+        'total_sessions': {'$cond': [
+            {'$eq': ['$session_storage', 'collection']},
+            '$session_count',
+            {'$size': sessions},
+        ]},
+        'completed_sessions': {'$cond': [
+            {'$eq': ['$session_storage', 'collection']},
+            '$completed_count',
+            {'$size': {'$filter': {
+                'input': sessions,
+                'as': 'session',
+                'cond': {'$eq': ['$$session.completed', True]},
+            }}},
+        ]},
+        'next_exam_date': {'$min': {'$filter': {
+            'input': {'$ifNull': ['$subjects.exam_date', []]},
+            'as': 'exam_date',
+            'cond': {'$gte': ['$$exam_date', today]},
+        }}},
+    }
+
+@api_router.get("/study-plans", response_model=List[Dict])
+async def get_study_plans(
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    if_none_match: Optional[str] = Header(None),
+):
+    """
+    List plans newest first, one page at a time. Each plan is returned as a
+    summary with session counts unless `fields` names the fields to return.
+    The cursor for the next page is sent in the X-Next-Cursor header. The
+    page's ETag covers the plans' versions, so unchanged pages answer 304.
+    """
+    try:
+        today = datetime.utcnow().date().isoformat()
+        query = {}
+        if cursor:
+            try:
+                created_at, last_id = decode_cursor(cursor)
+            except Exception:
+                raise HTTPException(status_code=400, detail="Invalid cursor")
+            query = {'$or': [
+                {'created_at': {'$lt': created_at}},
+                {'created_at': created_at, '_id': {'$lt': last_id}},
+            ]}
+
+        if fields:
+            requested = {f.strip() for f in fields.split(',') if f.strip()}
+            unknown = requested - PLAN_FIELDS
+            if unknown:
+                raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+            # created_at builds the next cursor and version the ETag
+            projection = {field: 1 for field in requested | {'created_at', 'version'}}
+            if 'sessions' in requested:
+                projection['session_storage'] = 1
+        else:
+            projection = plan_summary_projection(today)
+
+        pipeline = [
+            {'$match': query},
+            {'$sort': {'created_at': -1, '_id': -1}},
+            {'$limit': limit},
+            {'$project': projection},
+        ]
+        reads = read_db()
+        plans = await reads.study_plans.aggregate(pipeline).to_list(limit)
+
+        # Summaries count upcoming exams, so the page also depends on today
+        page_key = [limit, cursor, fields, today] + [[str(plan['_id']), plan.get('version', 0)] for plan in plans]
+        etag = '"' + hashlib.sha1(orjson.dumps(page_key)).hexdigest() + '"'
+        headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+        if len(plans) == limit:
+            last = plans[-1]
+            headers['X-Next-Cursor'] = encode_cursor(last['created_at'], last['_id'])
+        if etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=headers)
+
+        for plan in plans:
+            if 'session_storage' in plan:
+                await attach_sessions(plan, reads)
+            public_doc(plan)
+        return FastJSONResponse(plans, headers=headers)
+    except HTTPException:
+        raise  # Re-raise HTTPExceptions as-is
+    except Exception as e:
+        logging.error(f"Error fetching study plans: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@api_router.get("/study-plans/{plan_id}", response_model=StudyPlan)
+async def get_study_plan(plan_id: str, if_none_match: Optional[str] = Header(None)):
+    try:
+        plan_oid = ObjectId(plan_id)
+        reads = read_db()
+        if if_none_match:
+            # Check the version alone before reading the sessions
+            head = await reads.study_plans.find_one({'_id': plan_oid}, {'version': 1})
+            if not head:
+                raise HTTPException(status_code=404, detail="Study plan not found")
+            etag = plan_etag(plan_id, head.get('version', 0))
+            if etag_matches(if_none_match, etag):
+                return not_modified(etag)
+
+        plan = await reads.study_plans.find_one({'_id': plan_oid}, {'summary': 0})
+        if not plan:
+            raise HTTPException(status_code=404, detail="Study plan not found")
+        await attach_sessions(plan, reads)
+        etag = plan_etag(plan_id, plan.get('version', 0))
+        return FastJSONResponse(public_doc(plan), headers={'ETag': etag, 'Cache-Control': 'no-cache'})
+    except HTTPException:
+        raise  # Re-raise HTTPExceptions as-is
+    except Exception as e:
+        logging.error(f"Error fetching study plan: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@api_router.put("/study-plans/{plan_id}/sessions", response_model=Dict)
+async def update_session_status(plan_id: str, update_data: UpdateSessionStatus, full: bool = False):
+    """
+    Flip the completion flag of the matching sessions. The sessions are read
+    first, then the flags, version and summary counters are written in one
+    update guarded on the plan's version (see apply_session_completion).
+    Returns a compact delta unless `full=true` asks for the whole plan, which
+    the guarded write itself returns.
+    """
+    observe_parse()
+    try:
+        plan_oid = ObjectId(plan_id)
+        session_query = {
+            'date': update_data.date,
+            'subject': update_data.subject,
+            'topic': update_data.topic,
+        }
+        if full:
+            plan = await apply_session_completion(
+                plan_oid, [(session_query, update_data.completed)], return_plan=True
+            )
+            if not plan:
+                raise HTTPException(status_code=404, detail="Study plan not found")
+            return FastJSONResponse(public_doc(plan))
+
+        modified = await apply_session_completion(plan_oid, [(session_query, update_data.completed)])
+        if modified is None:
+            raise HTTPException(status_code=404, detail="Study plan not found")
+
+        return {
+            'id': plan_id,
+            **session_query,
+            'completed': update_data.completed,
+            'modified': modified,
+        }
+    except HTTPException:
+        raise  # Re-raise HTTPExceptions as-is
+    except Exception as e:
+        logging.error(f"Error updating session: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@api_router.get("/study-plans/{plan_id}/sessions", response_model=Dict)
+async def get_sessions_in_window(
+    plan_id: str,
+    date_from: Optional[str] = Query(None, alias='from'),
+    date_to: Optional[str] = Query(None, alias='to'),
+    subject: Optional[str] = None,
+    completed: Optional[bool] = None,
+):
+    """
+    Sessions between `from` and `to` (inclusive ISO dates), optionally narrowed
+    by subject and completion. Filtering happens in MongoDB so the response
+    only carries the requested window.
+    """
+    try:
+        for value in (date_from, date_to):
+            if value:
+                try:
+                    datetime.fromisoformat(value)
+                except ValueError:
+                    raise HTTPException(status_code=400, detail=f"Invalid date: {value}")
+
+        plan_oid = ObjectId(plan_id)
+        conditions = []
+        if date_from:
+            conditions.append({'$gte': ['$$session.date', date_from]})
+        if date_to:
+            conditions.append({'$lte': ['$$session.date', date_to]})
+        if subject is not None:
+            conditions.append({'$eq': ['$$session.subject', subject]})
+        if completed is not None:
+            conditions.append({'$eq': ['$$session.completed', completed]})
+
+        pipeline = [
+            {'$match': {'_id': plan_oid}},
+            {'$project': {
+                'session_storage': 1,
+                'sessions': {'$filter': {
+                    'input': {'$ifNull': ['$sessions', []]},
+                    'as': 'session',
+                    'cond': {'$and': conditions},
+                }},
+            }},
+        ]
+        reads = read_db()
+        plans = await reads.study_plans.aggregate(pipeline).to_list(1)
+        if not plans:
+            raise HTTPException(status_code=404, detail="Study plan not found")
+
+        plan = plans[0]
+        if plan.get('session_storage') == 'collection':
+            filters = {}
+            if subject is not None:
+                filters['subject'] = subject
+            if completed is not None:
+                filters['completed'] = completed
+            sessions = await find_sessions(plan_oid, date_from, date_to, filters, reads)
+        else:
+            sessions = plan['sessions']
+
+        return FastJSONResponse({
+            'id': plan_id,
+            'from': date_from,
+            'to': date_to,
+            'sessions': sessions,
+        })
+    except HTTPException:
+        raise  # Re-raise HTTPExceptions as-is
+    except Exception as e:
+        logging.error(f"Error fetching sessions: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@api_router.get("/study-plans/{plan_id}/agenda", response_model=Dict)
+async def get_agenda(plan_id: str, date: Optional[str] = None):
+    """
+    One day of a plan: that day's sessions and totals plus progress per
+    subject. Totals come from the plan summary, so only the day's sessions
+    are read; a plan without a summary has one built and saved first.
+    """
+    try:
+        day = date or datetime.utcnow().date().isoformat()
+        try:
+            day_date = datetime.fromisoformat(day).date()
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Invalid date: {day}")
+        day = day_date.isoformat()
+
+        plan_oid = ObjectId(plan_id)
+        pipeline = [
+            {'$match': {'_id': plan_oid}},
+            {'$project': {
+                'version': 1,
+                'session_storage': 1,
+                'summary_subjects': '$summary.subjects',
+                'summary_day': f'$summary.days.{day}',
+                'has_summary': {'$ne': [{'$ifNull': ['$summary', None]}, None]},
+                'sessions': {'$filter': {
+                    'input': {'$ifNull': ['$sessions', []]},
+                    'as': 'session',
+                    'cond': {'$eq': ['$$session.date', day]},
+                }},
+            }},
+        ]
+        reads = read_db()
+        plans = await reads.study_plans.aggregate(pipeline).to_list(1)
+        if not plans:
+            raise HTTPException(status_code=404, detail="Study plan not found")
+
+        plan = plans[0]
+        collection_mode = plan.get('session_storage') == 'collection'
+        if collection_mode:
+            sessions = await find_sessions(plan_oid, day, day, database=reads)
+        else:
+            sessions = plan['sessions']
+
+        if plan['has_summary']:
+            subject_totals = plan.get('summary_subjects') or {}
+            day_totals = plan.get('summary_day') or empty_totals()
+        else:
+            full = await db.study_plans.find_one(
+                {'_id': plan_oid}, {'subjects': 1, 'sessions': 1, 'session_storage': 1}
+            )
+            if full is None:
+                raise HTTPException(status_code=404, detail="Study plan not found")
+            await attach_sessions(full)
+            summary = build_plan_summary(full.get('subjects') or [], full.get('sessions') or [])
+            await db.study_plans.update_one(
+                {'_id': plan_oid, **version_guard(plan.get('version')), 'summary': {'$exists': False}},
+                {'$set': {'summary': summary}},
+            )
+            subject_totals = summary['subjects']
+            day_totals = summary['days'].get(day, empty_totals())
+
+        subjects = []
+        for key in sorted(subject_totals, key=int):
+            totals = subject_totals[key]
+            exam_day = datetime.fromisoformat(totals['exam_date']).date()
+            subjects.append({
+                'name': totals['name'],
+                'exam_date': totals['exam_date'],
+                'days_left': (exam_day - day_date).days,
+                'sessions': totals['sessions'],
+                'completed': totals['completed'],
+                'hours': round(totals['hours'], 2),
+                'completed_hours': round(totals['completed_hours'], 2),
+                'completion_ratio': round(totals['completed'] / totals['sessions'], 4) if totals['sessions'] else 0.0,
+                'progress': round(totals['completed_hours'] / totals['hours'], 4) if totals['hours'] else 0.0,
+            })
+
+        return FastJSONResponse({
+            'id': plan_id,
+            'date': day,
+            'sessions': sessions,
+            'totals': {
+                'sessions': day_totals['sessions'],
+                'completed': day_totals['completed'],
+                'hours': round(day_totals['hours'], 2),
+                'completed_hours': round(day_totals['completed_hours'], 2),
+            },
+            'subjects': subjects,
+        })
+    except HTTPException:
+        raise  # Re-raise HTTPExceptions as-is
+    except Exception as e:
+        logging.error(f"Error fetching agenda: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@api_router.get("/study-plans/{plan_id}/sessions/{session_id}", response_model=Dict)
+async def get_session(plan_id: str, session_id: str):
+    try:
+        plan_oid = ObjectId(plan_id)
+        reads = read_db()
+        plan = await reads.study_plans.find_one(
+            {'_id': plan_oid, 'sessions.id': session_id},
+            {'sessions': {'$elemMatch': {'id': session_id}}},
+        )
+        if plan:
+            return FastJSONResponse(plan['sessions'][0])
+
+        session = await reads.study_sessions.find_one(
+            {'plan_id': plan_oid, 'id': session_id},
+            {'_id': 0, 'plan_id': 0},
+        )
+        if not session:
+            raise HTTPException(status_code=404, detail="Session not found")
+        return FastJSONResponse(session)
+    except HTTPException:
+        raise  # Re-raise HTTPExceptions as-is
+    except Exception as e:
+        logging.error(f"Error fetching session: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@api_router.patch("/study-plans/{plan_id}/sessions/{session_id}", response_model=Dict)
+async def patch_session(plan_id: str, session_id: str, patch: PatchSession):
+    observe_parse()
+    try:
+        plan_oid = ObjectId(plan_id)
+        modified = await apply_session_completion(plan_oid, [({'id': session_id}, patch.completed)])
+        if modified is None:
+            raise HTTPException(status_code=404, detail="Study plan not found")
+
+        plan = await db.study_plans.find_one(
+            {'_id': plan_oid, 'sessions.id': session_id},
+            {'sessions': {'$elemMatch': {'id': session_id}}},
+        )
+        if plan:
+            return plan['sessions'][0]
+
+        session = await db.study_sessions.find_one(
+            {'plan_id': plan_oid, 'id': session_id},
+            {'_id': 0, 'plan_id': 0},
+        )
+        if not session:
+            raise HTTPException(status_code=404, detail="Session not found")
+        return session
+    except HTTPException:
+        raise  # Re-raise HTTPExceptions as-is
+    except Exception as e:
+        logging.error(f"Error updating session: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@api_router.patch("/study-plans/{plan_id}/sessions", response_model=Dict)
+async def bulk_patch_sessions(plan_id: str, bulk: BulkPatchSessions):
+    """
+    Apply many completion changes, e.g. a whole day, in one update. Only the
+    sessions the plan has are echoed back; requested IDs it doesn't have
+    (stale or mistyped) are listed in `unknown_ids` and left alone.
+    """
+    observe_parse()
+    try:
+        plan_oid = ObjectId(plan_id)
+        # Last write wins when the same session appears more than once
+        requested = {item.id: item.completed for item in bulk.sessions}
+        known = await known_session_ids(plan_oid, list(requested))
+        if known is None:
+            raise HTTPException(status_code=404, detail="Study plan not found")
+        completion = {sid: completed for sid, completed in requested.items() if sid in known}
+        done_ids = [sid for sid, completed in completion.items() if completed]
+        todo_ids = [sid for sid, completed in completion.items() if not completed]
+
+        changes = []
+        if done_ids:
+            changes.append(({'id': {'$in': done_ids}}, True))
+        if todo_ids:
+            changes.append(({'id': {'$in': todo_ids}}, False))
+
+        if await apply_session_completion(plan_oid, changes) is None:
+            raise HTTPException(status_code=404, detail="Study plan not found")
+
+        return {
+            'id': plan_id,
+            'sessions': [{'id': sid, 'completed': completed} for sid, completed in completion.items()],
+            'unknown_ids': [sid for sid in requested if sid not in known],
+        }
+    except HTTPException:
+        raise  # Re-raise HTTPExceptions as-is
+    except Exception as e:
+        logging.error(f"Error updating sessions: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@api_router.post("/study-plans/{plan_id}/reschedule", response_model=Dict)
+@profiled('reschedule_study_plan')
+async def reschedule_study_plan(plan_id: str, edits: RescheduleRequest):
+    """
+    Re-plan from `from_date` forward after edits. Past days and completed
+    sessions are left alone; only incomplete future sessions are replaced,
+    and only the removed and added sessions are written.
+    """
+    observe_parse()
+    try:
+        from_date = edits.from_date or datetime.utcnow().date().isoformat()
+        try:
+            datetime.fromisoformat(from_date)
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Invalid date: {from_date}")
+
+        plan_oid = ObjectId(plan_id)
+        session_fields = {'id': 1, 'date': 1, 'subject': 1, 'topic': 1, 'duration': 1, 'completed': 1}
+        plan = await db.study_plans.find_one(
+            {'_id': plan_oid},
+            {'subjects': 1, 'daily_hours': 1, 'strategy': 1, 'session_storage': 1, 'version': 1,
+             **{f'sessions.{field}': 1 for field in session_fields}},
+        )
+        if not plan:
+            raise HTTPException(status_code=404, detail="Study plan not found")
+        collection_mode = plan.get('session_storage') == 'collection'
+        if collection_mode:
+            sessions = await db.study_sessions.find({'plan_id': plan_oid}, {'_id': 0, **session_fields}).to_list(None)
+        else:
+            sessions = plan.get('sessions') or []
+
+        try:
+            subjects = apply_plan_edits([Subject(**subject) for subject in plan['subjects']], edits)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        daily_hours = edits.daily_hours or plan['daily_hours']
+
+        to_schedule, calendar, expired = remaining_work(subjects, sessions, from_date, edits.missed_session_ids)
+        new_sessions = []
+        if to_schedule:
+            new_sessions = await schedule_executor.generate(
+                to_schedule, daily_hours, from_date, calendar,
+                first_seq=next_session_seq(sessions),
+                strategy=plan.get('strategy', 'greedy'),
+            )
+
+        # Persist the diff: drop incomplete sessions from from_date on, add the new ones
+        stale = {'date': {'$gte': from_date}, 'completed': False}
+        plan_fields = {
+            'subjects': [subject.dict() for subject in subjects],
+            'daily_hours': daily_hours,
+        }
+        if collection_mode:
+            removed = (await db.study_sessions.delete_many({'plan_id': plan_oid, **stale})).deleted_count
+            await insert_plan_sessions(plan_oid, new_sessions)
+            await db.study_plans.update_one(
+                {'_id': plan_oid},
+                {'$set': plan_fields, '$inc': {'session_count': len(new_sessions) - removed, 'version': 1}},
+            )
+        else:
+            removed = sum(
+                1 for session in sessions
+                if session['date'] >= from_date and not session.get('completed')
+            )
+            await db.study_plans.bulk_write([
+                UpdateOne(
+                    {'_id': plan_oid},
+                    {'$set': plan_fields, '$pull': {'sessions': stale}, '$inc': {'version': 1}},
+                ),
+                UpdateOne({'_id': plan_oid}, {'$push': {'sessions': {
+                    '$each': new_sessions,
+                    '$sort': {'date': 1, 'start_time': 1},
+                }}}),
+            ], ordered=True)
+
+        kept = [
+            session for session in sessions
+            if session['date'] < from_date or session.get('completed')
+        ]
+        await store_plan_summary(
+            plan_oid,
+            (plan.get('version') or 0) + 1,
+            build_plan_summary(plan_fields['subjects'], kept + new_sessions),
+        )
+
+        return {
+            'id': plan_id,
+            'from_date': from_date,
+            'removed': removed,
+            'added': new_sessions,
+            'unscheduled_subjects': expired,
+        }
+    except HTTPException:
+        raise  # Re-raise HTTPExceptions as-is
+    except SchedulerBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={'Retry-After': '1'})
+    except InfeasiblePlanError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except Exception as e:
+        logging.error(f"Error rescheduling study plan: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@api_router.post("/admin/migrate-sessions")
+async def migrate_sessions(min_sessions: int = SESSION_COLLECTION_THRESHOLD, limit: int = Query(100, ge=0)):
+    """Move embedded plans with at least `min_sessions` sessions to study_sessions"""
+    try:
+        migrated = await migrate_embedded_plans(min_sessions=min_sessions, limit=limit)
+        return {"migrated": migrated}
+    except Exception as e:
+        logging.error(f"Error migrating sessions: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Bulk export
+EXPORT_BATCH_SIZE = int(os.environ.get('EXPORT_BATCH_SIZE', '200'))
+EXPORT_CHUNK_BYTES = 64 * 1024
+
+PLAN_EXPORT_COLUMNS = ['id', 'student_id', 'created_at', 'start_date', 'daily_hours',
+                       'subjects', 'session_count', 'completed_count']
+SESSION_EXPORT_COLUMNS = ['plan_id', 'student_id', 'id', 'subject', 'topic', 'date',
+                          'start_time', 'end_time', 'duration', 'completed']
+
+async def iter_plan_sessions(plan: Dict, batch_size: int):
+    """A plan's sessions in schedule order, whichever layout it uses"""
+    if plan.get('session_storage') == 'collection':
+        cursor = read_db().study_sessions.find({'plan_id': plan['_id']}, {'_id': 0, 'plan_id': 0})
+        cursor = cursor.sort([('date', ASCENDING), ('start_time', ASCENDING), ('_id', ASCENDING)])
+        async for session in cursor.batch_size(batch_size):
+            yield session
+    else:
+        for session in plan.get('sessions') or []:
+            yield session
+
+async def iter_export_rows(unit: str, batch_size: int):
+    """Yield one dict per plan or per session, reading with bounded cursor batches"""
+    cursor = read_db().study_plans.find({}, {'summary': 0}).sort('_id', ASCENDING).batch_size(batch_size)
+    async for plan in cursor:
+        sessions = iter_plan_sessions(plan, batch_size)
+        if unit == 'plan':
+            plan['sessions'] = [session async for session in sessions]
+            for field in SESSION_STORAGE_FIELDS:
+                plan.pop(field, None)
+            yield public_doc(plan)
+        else:
+            plan_id = str(plan['_id'])
+            student_id = plan.get('student_id')
+            async for session in sessions:
+                yield {'plan_id': plan_id, 'student_id': student_id, **session}
+
+def plan_csv_row(plan: Dict) -> List:
+    sessions = plan.get('sessions') or []
+    return [
+        plan['id'], plan.get('student_id'), plan.get('created_at'), plan.get('start_date'),
+        plan.get('daily_hours'), ';'.join(subject['name'] for subject in plan.get('subjects') or []),
+        len(sessions), sum(1 for session in sessions if session.get('completed')),
+    ]
+
+async def export_stream(unit: str, fmt: str, batch_size: int):
+    """Encode export rows as NDJSON or CSV, flushing in ~64KB chunks"""
+    buffer = io.StringIO() if fmt == 'csv' else bytearray()
+    writer = csv.writer(buffer) if fmt == 'csv' else None
+    if writer:
+        writer.writerow(PLAN_EXPORT_COLUMNS if unit == 'plan' else SESSION_EXPORT_COLUMNS)
+
+    async for row in iter_export_rows(unit, batch_size):
+        if writer:
+            if unit == 'plan':
+                writer.writerow(plan_csv_row(row))
+            else:
+                writer.writerow([row.get(column) for column in SESSION_EXPORT_COLUMNS])
+            if buffer.tell() >= EXPORT_CHUNK_BYTES:
+                yield buffer.getvalue().encode()
+                buffer.seek(0)
+                buffer.truncate()
+        else:
+            buffer += orjson.dumps(row, default=orjson_default)
+            buffer += b"\n"
+            if len(buffer) >= EXPORT_CHUNK_BYTES:
+                yield bytes(buffer)
+                buffer.clear()
+
+    remainder = buffer.getvalue().encode() if writer else bytes(buffer)
+    if remainder:
+        yield remainder
+
+@api_router.get("/export/plans")
+async def export_plans(
+    format: str = Query('ndjson', pattern='^(ndjson|csv)$'),
+    unit: str = Query('plan', pattern='^(plan|session)$'),
+    batch_size: int = Query(EXPORT_BATCH_SIZE, ge=1, le=5000),
+):
+    """
+    Stream every plan (or every session) as NDJSON or CSV. The Mongo cursor
+    is read in bounded batches and output is flushed as it is produced, so
+    memory stays flat however large the collection is.
+    """
+    media_type = 'text/csv' if format == 'csv' else 'application/x-ndjson'
+    filename = f"study_{unit}s.{'csv' if format == 'csv' else 'ndjson'}"
+    return StreamingResponse(
+        export_stream(unit, format, batch_size),
+        media_type=media_type,
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'},
+    )
+
+# Bulk import
+IMPORT_BATCH_SIZE = int(os.environ.get('IMPORT_BATCH_SIZE', '500'))
+IMPORT_MAX_ERRORS = 1000  # per-line errors reported back; the rest are only counted
+
+async def iter_lines(chunks):
+    """Split a stream of byte chunks into lines"""
+    pending = b''
+    async for chunk in chunks:
+        pending += chunk
+        *lines, pending = pending.split(b'\n')
+        for line in lines:
+            yield line
+    if pending:
+        yield pending
+
+def imported_plan_document(record: Dict) -> Dict:
+    """Stored form of an exported plan that already has its sessions"""
+    plan = StudyPlan(**record)
+    plan_dict = plan.dict(exclude={'id'})
+    if plan_dict.get('student_id') is None:
+        plan_dict.pop('student_id', None)
+    for seq, session in enumerate(plan_dict['sessions']):
+        if not session.get('id'):
+            session['id'] = session_id(seq)
+    plan_dict['summary'] = build_plan_summary(plan_dict['subjects'], plan_dict['sessions'])
+    return plan_dict
+
+async def import_plans(lines, regenerate: bool = False, batch_size: int = IMPORT_BATCH_SIZE) -> Dict:
+    """
+    Load NDJSON plans in bounded unordered insert_many batches. Records are
+    validated against StudyPlan, or against StudyPlanCreate with a freshly
+    generated schedule when `regenerate` is set or a record has no sessions.
+    Each batch is written before more input is read, which throttles the
+    producer to the database's pace.
+    """
+    started = time.perf_counter()
+    today = datetime.utcnow().date().isoformat()
+    stats = {'lines': 0, 'inserted': 0, 'failed': 0, 'errors': []}
+    batch = []  # (line number, record)
+    # One generation per worker in flight, as in batch creation, so large
+    # regenerating batches wait for the pool instead of overflowing its queue
+    slots = asyncio.Semaphore(schedule_executor.pool_size)
+
+    def record_error(line_no: int, message: str):
+        stats['failed'] += 1
+        if len(stats['errors']) < IMPORT_MAX_ERRORS:
+            stats['errors'].append({'line': line_no, 'error': message})
+
+    async def build(record: Dict) -> Dict:
+        if regenerate or not record.get('sessions'):
+            plan_data = StudyPlanCreate(**record)
+            start_date = plan_data.start_date or today
+            async with slots:
+                sessions = await build_schedule(
+                    plan_data.subjects, plan_data.daily_hours, start_date, plan_data.strategy
+                )
+            return new_plan_document(plan_data, start_date, sessions)
+        return imported_plan_document(record)
+
+    async def flush():
+        built = await asyncio.gather(*(build(record) for _, record in batch), return_exceptions=True)
+        ready = []
+        for (line_no, _), outcome in zip(batch, built):
+            if isinstance(outcome, Exception):
+                record_error(line_no, str(outcome) or type(outcome).__name__)
+            else:
+                ready.append((line_no, outcome))
+        errors = await insert_plans([plan_dict for _, plan_dict in ready])
+        for (line_no, _), error in zip(ready, errors):
+            if error:
+                record_error(line_no, error)
+            else:
+                stats['inserted'] += 1
+        batch.clear()
+
+    async for line in lines:
+        stats['lines'] += 1
+        if not line.strip():
+            continue
+        try:
+            record = orjson.loads(line)
+            if not isinstance(record, dict):
+                raise ValueError("Expected a JSON object")
+        except ValueError as e:
+            record_error(stats['lines'], f"Invalid JSON: {str(e)}")
+            continue
+        batch.append((stats['lines'], record))
+        if len(batch) >= batch_size:
+            await flush()
+    if batch:
+        await flush()
+
+    elapsed = time.perf_counter() - started
+    stats['elapsed_seconds'] = round(elapsed, 3)
+    stats['plans_per_second'] = round(stats['inserted'] / elapsed, 1) if elapsed > 0 else None
+    return stats
+
+@api_router.post("/import/plans", response_model=Dict)
+async def import_plans_endpoint(
+    request: Request,
+    regenerate: bool = False,
+    batch_size: int = Query(IMPORT_BATCH_SIZE, ge=1, le=5000),
+):
+    """Import an NDJSON request body (one plan per line), streamed as it arrives"""
+    try:
+        return await import_plans(iter_lines(request.stream()), regenerate=regenerate, batch_size=batch_size)
+    except Exception as e:
+        logging.error(f"Error importing study plans: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Analytics
+# Cross-plan reports for coordinators. Each one is a single aggregation
+# that unwinds the embedded sessions (or subjects.topics) and, through
+# $unionWith, the sessions of collection-mode plans, then groups server-side
+# with allowDiskUse. Results are cached for ANALYTICS_CACHE_TTL_SECONDS and
+# concurrent misses for the same report share one query.
+ANALYTICS_CACHE_SIZE = int(os.environ.get('ANALYTICS_CACHE_SIZE', '128'))  # 0 disables the cache
+ANALYTICS_CACHE_TTL = float(os.environ.get('ANALYTICS_CACHE_TTL_SECONDS', '60'))
+ANALYTICS_TOPIC_LIMIT = 100
+
+analytics_cache = ScheduleCache(ANALYTICS_CACHE_SIZE, ANALYTICS_CACHE_TTL)
+_analytics_pending: Dict[str, asyncio.Future] = {}
+
+def analytics_date_range(date_from: Optional[str], date_to: Optional[str]) -> Dict:
+    """Validated {'$gte', '$lte'} bounds for ISO date strings, empty when unbounded"""
+    bounds = {}
+    for op, value in (('$gte', date_from), ('$lte', date_to)):
+        if value:
+            try:
+                bounds[op] = datetime.fromisoformat(value).date().isoformat()
+            except ValueError:
+                raise HTTPException(status_code=400, detail=f"Invalid date: {value}")
+    return bounds
+
+def all_sessions_pipeline(date_range: Dict) -> List[Dict]:
+    """Stages yielding one document per session of every plan, in either layout"""
+    date_match = [{'$match': {'date': date_range}}] if date_range else []
+    plan_match = dict(EMBEDDED_SESSIONS)
+    if date_range:
+        plan_match['sessions'] = {'$elemMatch': {'date': date_range}}
+    return [
+        {'$match': plan_match},
+        {'$project': {
+            'sessions.date': 1, 'sessions.subject': 1,
+            'sessions.duration': 1, 'sessions.completed': 1,
+        }},
+        {'$unwind': '$sessions'},
+        {'$project': {
+            '_id': 0, 'plan_id': '$_id',
+            'date': '$sessions.date', 'subject': '$sessions.subject',
+            'duration': '$sessions.duration', 'completed': '$sessions.completed',
+        }},
+        *date_match,
+        {'$unionWith': {'coll': 'study_sessions', 'pipeline': [
+            *date_match,
+            {'$project': {'_id': 0, 'date': 1, 'subject': 1, 'duration': 1, 'completed': 1, 'plan_id': 1}},
+        ]}},
+    ]
+
+def session_totals_group(key) -> Dict:
+    return {
+        '_id': key,
+        'sessions': {'$sum': 1},
+        'completed': {'$sum': {'$cond': [{'$eq': ['$completed', True]}, 1, 0]}},
+        'hours': {'$sum': '$duration'},
+        'completed_hours': {'$sum': {'$cond': [{'$eq': ['$completed', True]}, '$duration', 0.0]}},
+    }
+
+async def run_analytics(collection: str, pipeline: List[Dict]) -> List[Dict]:
+    cursor = getattr(read_db(), collection).aggregate(pipeline, allowDiskUse=True)
+    return await cursor.to_list(None)
+
+async def cached_analytics(key: str, compute) -> Dict:
+    """Report for `key` from the cache, computing it at most once at a time"""
+    report = await analytics_cache.get(key)
+    if report is not None:
+        return report
+
+    pending = _analytics_pending.get(key)
+    if pending is None:
+        async def fill():
+            try:
+                result = {'generated_at': datetime.utcnow().isoformat(), **(await compute())}
+                await analytics_cache.put(key, result)
+                return result
+            finally:
+                _analytics_pending.pop(key, None)
+
+        pending = _analytics_pending[key] = asyncio.ensure_future(fill())
+    # A disconnecting client must not cancel the query others are waiting on
+    return await asyncio.shield(pending)
+
+def analytics_response(report: Dict) -> FastJSONResponse:
+    return FastJSONResponse(report, headers={'Cache-Control': f'private, max-age={int(ANALYTICS_CACHE_TTL)}'})
+
+def iso_week(day: str) -> tuple:
+    year, week, _ = date.fromisoformat(day).isocalendar()
+    return year, week
+
+@api_router.get("/analytics/subjects", response_model=Dict)
+async def subject_completion_analytics(
+    date_from: Optional[str] = Query(None, alias='from'),
+    date_to: Optional[str] = Query(None, alias='to'),
+):
+    """Completion rate by subject name across all plans, for sessions dated in the range"""
+    try:
+        date_range = analytics_date_range(date_from, date_to)
+
+        async def compute():
+            pipeline = all_sessions_pipeline(date_range) + [
+                {'$group': {
+                    **session_totals_group('$subject'),
+                    'plans': {'$addToSet': '$plan_id'},
+                }},
+                {'$project': {
+                    'sessions': 1, 'completed': 1, 'hours': 1, 'completed_hours': 1,
+                    'plans': {'$size': '$plans'},
+                }},
+                {'$sort': {'_id': 1}},
+            ]
+            rows = await run_analytics('study_plans', pipeline)
+            return {'subjects': [
+                {
+                    'subject': row['_id'],
+                    'plans': row['plans'],
+                    'sessions': row['sessions'],
+                    'completed': row['completed'],
+                    'hours': round(row['hours'], 2),
+                    'completed_hours': round(row['completed_hours'], 2),
+                    'completion_rate': round(row['completed'] / row['sessions'], 4) if row['sessions'] else 0.0,
+                }
+                for row in rows
+            ]}
+
+        key = f"subjects|{date_range.get('$gte')}|{date_range.get('$lte')}"
+        report = await cached_analytics(key, compute)
+        return analytics_response({'from': date_from, 'to': date_to, **report})
+    except HTTPException:
+        raise  # Re-raise HTTPExceptions as-is
+    except Exception as e:
+        logging.error(f"Error computing subject analytics: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@api_router.get("/analytics/weekly-hours", response_model=Dict)
+async def weekly_hours_analytics(
+    date_from: Optional[str] = Query(None, alias='from'),
+    date_to: Optional[str] = Query(None, alias='to'),
+):
+    """
+    Hours scheduled and completed per ISO week across all plans. Sessions
+    are grouped per day in MongoDB; the few hundred day rows are rolled up
+    into weeks here, which keeps the pipeline free of date operators.
+    """
+    try:
+        date_range = analytics_date_range(date_from, date_to)
+
+        async def compute():
+            pipeline = all_sessions_pipeline(date_range) + [
+                {'$group': session_totals_group('$date')},
+            ]
+            weeks: Dict[tuple, Dict] = {}
+            for row in await run_analytics('study_plans', pipeline):
+                week = weeks.setdefault(iso_week(row['_id']), empty_totals())
+                for field in week:
+                    week[field] += row[field]
+            return {'weeks': [
+                {
+                    'week': f"{year}-W{number:02d}",
+                    'week_start': date.fromisocalendar(year, number, 1).isoformat(),
+                    'sessions': totals['sessions'],
+                    'completed': totals['completed'],
+                    'hours': round(totals['hours'], 2),
+                    'completed_hours': round(totals['completed_hours'], 2),
+                }
+                for (year, number), totals in sorted(weeks.items())
+            ]}
+
+        key = f"weekly-hours|{date_range.get('$gte')}|{date_range.get('$lte')}"
+        report = await cached_analytics(key, compute)
+        return analytics_response({'from': date_from, 'to': date_to, **report})
+    except HTTPException:
+        raise  # Re-raise HTTPExceptions as-is
+    except Exception as e:
+        logging.error(f"Error computing weekly analytics: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@api_router.get("/analytics/weak-topics", response_model=Dict)
+async def weak_topic_analytics(
+    date_from: Optional[str] = Query(None, alias='from'),
+    date_to: Optional[str] = Query(None, alias='to'),
+    limit: int = Query(20, ge=1, le=ANALYTICS_TOPIC_LIMIT),
+):
+    """Topics most often marked weak, over plans whose start date is in the range"""
+    try:
+        date_range = analytics_date_range(date_from, date_to)
+
+        async def compute():
+            pipeline = [
+                *([{'$match': {'start_date': date_range}}] if date_range else []),
+                {'$project': {'subjects.name': 1, 'subjects.topics.name': 1, 'subjects.topics.difficulty': 1}},
+                {'$unwind': '$subjects'},
+                {'$unwind': '$subjects.topics'},
+                {'$group': {
+                    '_id': {'subject': '$subjects.name', 'topic': '$subjects.topics.name'},
+                    'plans': {'$sum': 1},
+                    'weak': {'$sum': {'$cond': [{'$eq': ['$subjects.topics.difficulty', 'weak']}, 1, 0]}},
+                }},
+                {'$match': {'weak': {'$gt': 0}}},
+                {'$sort': {'weak': -1, '_id.subject': 1, '_id.topic': 1}},
+                {'$limit': limit},
+            ]
+            rows = await run_analytics('study_plans', pipeline)
+            return {'topics': [
+                {
+                    'subject': row['_id']['subject'],
+                    'topic': row['_id']['topic'],
+                    'weak': row['weak'],
+                    'plans': row['plans'],
+                    'weak_rate': round(row['weak'] / row['plans'], 4),
+                }
+                for row in rows
+            ]}
+
+        key = f"weak-topics|{date_range.get('$gte')}|{date_range.get('$lte')}|{limit}"
+        report = await cached_analytics(key, compute)
+        return analytics_response({'from': date_from, 'to': date_to, **report})
+    except HTTPException:
+        raise  # Re-raise HTTPExceptions as-is
+    except Exception as e:
+        logging.error(f"Error computing topic analytics: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@api_router.get("/scheduler/stats")
+async def get_scheduler_stats():
+    return {**schedule_executor.stats(), 'cache': schedule_cache.stats()}
+
+@api_router.get("/metrics")
+async def get_metrics():
+    """Request, phase and MongoDB histograms plus scheduler gauges in Prometheus text format"""
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.render())
+    lines.extend(pool_monitor.checkout_wait.render())
+    lines.extend(stats_gauges('mongo_pool', pool_monitor.stats()))
+    lines.extend(stats_gauges('scheduler', schedule_executor.stats()))
+    lines.extend(stats_gauges('schedule_cache', schedule_cache.stats()))
+    lines.extend(stats_gauges('analytics_cache', analytics_cache.stats()))
+    lines.extend(stats_gauges('jobs', job_queue.stats()))
+    return PlainTextResponse('\n'.join(lines) + '\n', media_type='text/plain; version=0.0.4')
+
+@api_router.get("/debug/profiles")
+async def list_profiles():
+    """The slowest captured request profiles, slowest first"""
+    return {
+        'sample_rate': PROFILE_SAMPLE_RATE,
+        'keep': profile_store.keep,
+        'profiles': profile_store.list(),
+    }
+
+@api_router.get("/debug/profiles/{profile_id}")
+async def get_profile(profile_id: int, format: Literal['pstats', 'speedscope'] = 'pstats'):
+    """
+    One profile as a marshalled pstats file (load with pstats.Stats or
+    snakeviz) or a speedscope JSON document
+    """
+    profile = profile_store.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    if format == 'speedscope':
+        return FastJSONResponse(
+            speedscope_document(profile),
+            headers={'Content-Disposition': f'attachment; filename="profile-{profile_id}.speedscope.json"'},
+        )
+    return Response(
+        marshal.dumps(merged_pstats(profile)),
+        media_type='application/octet-stream',
+        headers={'Content-Disposition': f'attachment; filename="profile-{profile_id}.prof"'},
+    )
+
+@api_router.delete("/study-plans/{plan_id}")
+async def delete_study_plan(plan_id: str):
+    try:
+        plan_oid = ObjectId(plan_id)
+        result = await db.study_plans.delete_one({'_id': plan_oid})
+        if result.deleted_count == 0:
+            raise HTTPException(status_code=404, detail="Study plan not found")
+        await db.study_sessions.delete_many({'plan_id': plan_oid})
+        return {"message": "Study plan deleted successfully"}
+    except HTTPException:
+        raise  # Re-raise HTTPExceptions as-is
+    except Exception as e:
+        logging.error(f"Error deleting study plan: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Include the router in the main app
+app.include_router(api_router)
+
+app.add_middleware(
+    CORSMiddleware,
+    allow_credentials=True,
+    allow_origins=["*"],
+    allow_methods=["*"],
+    allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
+)
+app.add_middleware(MetricsMiddleware)
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Indexes backing the API's query patterns
+STUDY_PLAN_INDEXES = [
+    # Plan listing sorts and pages on (created_at, _id)
+    IndexModel([('created_at', DESCENDING), ('_id', DESCENDING)], name='created_at_desc'),
+    # Session lookups by day and completion state
+    IndexModel([('sessions.date', ASCENDING), ('sessions.completed', ASCENDING)], name='sessions_date_completed'),
+]
+
+STUDY_SESSION_INDEXES = [
+    # Sessions of a plan in schedule order and date-window queries
+    IndexModel([('plan_id', ASCENDING), ('date', ASCENDING), ('start_time', ASCENDING)], name='plan_date'),
+    # Direct addressing by session ID
+    IndexModel([('plan_id', ASCENDING), ('id', ASCENDING)], name='plan_session_id'),
+    # Cross-plan date windows for analytics
+    IndexModel([('date', ASCENDING)], name='date'),
+]
+
+JOB_INDEXES = [
+    # Startup requeue scans by status in submission order
+    IndexModel([('status', ASCENDING), ('created_at', ASCENDING)], name='status_created_at'),
+    # Let MongoDB drop finished jobs once they expire
+    IndexModel([('expires_at', ASCENDING)], name='expires_at_ttl', expireAfterSeconds=0),
+]
+
+SCHEDULE_CACHE_INDEXES = [
+    # Let MongoDB drop persistent cache entries once they expire
+    IndexModel([('expires_at', ASCENDING)], name='expires_at_ttl', expireAfterSeconds=0),
+]
+
+@app.on_event("startup")
+async def ensure_indexes():
+    """Idempotently create the indexes for every collection the API uses"""
+    collections = [
+        (db.study_plans, STUDY_PLAN_INDEXES),
+        (db.study_sessions, STUDY_SESSION_INDEXES),
+        (db.jobs, JOB_INDEXES),
+    ]
+    if SCHEDULE_CACHE_PERSIST == 'mongo':
+        collections.append((db.schedule_cache, SCHEDULE_CACHE_INDEXES))
+    for collection, indexes in collections:
+        try:
+            created = await collection.create_indexes(indexes)
+            logger.info(f"{collection.name} indexes ready: {', '.join(created)}")
+        except Exception as e:
+            # The API still works on collection scans, so don't block startup
+            logger.error(f"Error ensuring {collection.name} indexes: {str(e)}")
+
+@app.on_event("startup")
+async def resume_jobs():
+    """Requeue jobs that were waiting, or running when their worker stopped"""
+    try:
+        requeued = 0
+        async for job in db.jobs.find({'status': 'queued'}, {'_id': 1}).sort('created_at', ASCENDING):
+            job_queue.enqueue(job['_id'], requeued=True)
+            requeued += 1
+        requeued += await requeue_stale_jobs()
+        if requeued:
+            logger.info(f"Requeued {requeued} plan creation jobs")
+    except Exception as e:
+        logger.error(f"Error requeueing jobs: {str(e)}")
+
+@app.on_event("shutdown")
+async def shutdown_job_workers():
+    await job_queue.shutdown()
+
+@app.on_event("shutdown")
+async def shutdown_db_client():
+    client.close()
+
+@app.on_event("shutdown")
+async def shutdown_scheduler_pool():
+    schedule_executor.shutdown()
+
+async def _import_file(path: str, regenerate: bool, batch_size: int):
+    async def read_chunks():
+        with open(path, 'rb') as handle:
+            while True:
+                chunk = await asyncio.to_thread(handle.read, 1 << 20)
+                if not chunk:
+                    break
+                yield chunk
+    try:
+        return await import_plans(iter_lines(read_chunks()), regenerate=regenerate, batch_size=batch_size)
+    finally:
+        schedule_executor.shutdown()
+        client.close()
+
+if __name__ == "__main__":
+    # Command line import, e.g. python server.py import plans.ndjson --regenerate
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Study Scheduler maintenance commands")
+    commands = parser.add_subparsers(dest='command', required=True)
+    import_parser = commands.add_parser('import', help="Import plans from an NDJSON file")
+    import_parser.add_argument('path')
+    import_parser.add_argument('--regenerate', action='store_true', help="Regenerate sessions for every plan")
+    import_parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    if args.command == 'import':
+        result = asyncio.run(_import_file(args.path, args.regenerate, args.batch_size))
+        print(json.dumps(result, indent=2))
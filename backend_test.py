@@ -322,8 +322,19 @@ class StudySchedulerTester:
                     )
                     
                     if update_response.status_code == 200:
-                        updated_plan = update_response.json()
-                        updated_sessions = updated_plan.get('sessions', [])
+                        # The PUT answers with a compact delta, not the plan
+                        delta = update_response.json()
+                        delta_ok = (
+                            delta.get('id') == plan_id and
+                            delta.get('completed') == True and
+                            all(delta.get(key) == update_data[key] for key in ('date', 'subject', 'topic')) and
+                            'modified' in delta and
+                            'sessions' not in delta
+                        )
+                        
+                        # Re-read the plan to confirm the flag was stored
+                        plan_response = requests.get(f"{self.base_url}/study-plans/{plan_id}", timeout=10)
+                        updated_sessions = plan_response.json().get('sessions', []) if plan_response.status_code == 200 else []
                         
                         # Find the updated session
                         updated_session = next(
@@ -334,7 +345,10 @@ class StudySchedulerTester:
                             None
                         )
                         
-                        if updated_session and updated_session['completed'] == True:
+                        if not delta_ok:
+                            self.log_result("Update Session - Valid Request", False, 
+                                          f"Unexpected delta: {delta}")
+                        elif updated_session and updated_session['completed'] == True:
                             self.log_result("Update Session - Valid Request", True)
                         else:
                             self.log_result("Update Session - Valid Request", False, 
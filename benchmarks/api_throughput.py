@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+End-to-end API throughput and latency benchmark
+Runs the FastAPI app in-process through httpx's ASGI transport against
+mongomock (the default) or a local mongod given by --mongo-url, and reports
+throughput and latency percentiles per scenario. The toggle scenario needs
+arrayFilters, which mongomock lacks, so it only runs against mongod.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Dict, List
+
+os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+os.environ.setdefault('DB_NAME', 'benchmark_db')
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend'))
+
+import httpx  # noqa: E402
+
+import server  # noqa: E402
+from workloads import START_DATE, make_plan_payload  # noqa: E402
+
+SCENARIOS = ['create', 'get', 'list', 'sessions_window', 'toggle']
+MONGOD_ONLY = {'toggle'}
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+async def run_scenario(client, make_request, total: int, concurrency: int) -> Dict:
+    """Send `total` requests from `concurrency` workers and summarize latencies"""
+    latencies: List[float] = []
+    errors = 0
+    issued = 0
+
+    async def worker():
+        nonlocal errors, issued
+        while issued < total:
+            n = issued
+            issued += 1
+            method, url, body = make_request(n)
+            t0 = time.perf_counter()
+            response = await client.request(method, url, json=body)
+            latencies.append(time.perf_counter() - t0)
+            if response.status_code >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'requests': total,
+        'errors': errors,
+        'throughput_rps': total / elapsed if elapsed else 0.0,
+        'mean_ms': sum(latencies) / len(latencies) * 1000 if latencies else 0.0,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p90_ms': percentile(latencies, 0.90) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'max_ms': latencies[-1] * 1000 if latencies else 0.0,
+    }
+
+
+def use_database(mongo_url: str = None, client_options: Dict = None, pool_monitor=None):
+    """
+    Point the app at mongomock, or at a throwaway database on a real mongod
+    using the server's MONGO_* client options with `client_options` on top
+    """
+    db_name = f"benchmark_{os.getpid()}"
+    if mongo_url:
+        from motor.motor_asyncio import AsyncIOMotorClient
+        listeners = [server.MongoCommandTimer()] + ([pool_monitor] if pool_monitor else [])
+        options = {**server.mongo_client_options(), **(client_options or {})}
+        mongo_client = AsyncIOMotorClient(mongo_url, event_listeners=listeners, **options)
+        backend = 'mongod'
+    else:
+        from mongomock_motor import AsyncMongoMockClient
+        mongo_client = AsyncMongoMockClient()
+        backend = 'mongomock'
+    server.db = mongo_client[db_name]
+    return mongo_client, db_name, backend
+
+
+async def run_api_benchmark(
+    workload: str = 'medium',
+    requests: int = 200,
+    concurrency: int = 8,
+    seed: int = 42,
+    mongo_url: str = None,
+    scenarios: List[str] = SCENARIOS,
+    client_options: Dict = None,
+    pool_monitor=None,
+) -> Dict:
+    mongo_client, db_name, backend = use_database(mongo_url, client_options, pool_monitor)
+    rng = random.Random(seed)
+    results = {'backend': backend, 'workload': workload, 'concurrency': concurrency, 'scenarios': {}}
+    plan_ids: List[str] = []
+    plan_sessions: Dict[str, List[Dict]] = {}
+
+    # Distinct start dates keep every create a schedule cache miss
+    payloads = [
+        make_plan_payload(rng, workload, start=START_DATE + timedelta(days=n))
+        for n in range(requests)
+    ]
+
+    def create(n):
+        return 'POST', '/api/study-plans', payloads[n]
+
+    def get(n):
+        return 'GET', f"/api/study-plans/{rng.choice(plan_ids)}", None
+
+    def list_plans(n):
+        return 'GET', '/api/study-plans?limit=20', None
+
+    def sessions_window(n):
+        plan_id = rng.choice(plan_ids)
+        start = date.fromisoformat(plan_sessions[plan_id][0]['date'])
+        return 'GET', (
+            f"/api/study-plans/{plan_id}/sessions"
+            f"?from={start.isoformat()}&to={(start + timedelta(days=6)).isoformat()}"
+        ), None
+
+    def toggle(n):
+        plan_id = rng.choice(plan_ids)
+        session = rng.choice(plan_sessions[plan_id])
+        body = {
+            'date': session['date'],
+            'subject': session['subject'],
+            'topic': session['topic'],
+            'completed': n % 2 == 0,
+        }
+        return 'PUT', f"/api/study-plans/{plan_id}/sessions", body
+
+    makers = {
+        'create': create,
+        'get': get,
+        'list': list_plans,
+        'sessions_window': sessions_window,
+        'toggle': toggle,
+    }
+
+    transport = httpx.ASGITransport(app=server.app)
+    try:
+        await server.ensure_indexes()
+        # Start the worker pool before timing anything
+        warmup = make_plan_payload(random.Random(seed), 'small')
+        await server.schedule_executor.generate(
+            [server.Subject(**subject) for subject in warmup['subjects']],
+            warmup['daily_hours'],
+            warmup['start_date'],
+        )
+        async with httpx.AsyncClient(transport=transport, base_url='http://benchmark') as client:
+            # Later scenarios read the plans that create stores, so it always runs
+            for name in ['create'] + [name for name in scenarios if name != 'create']:
+                if name in MONGOD_ONLY and backend != 'mongod':
+                    continue
+                results['scenarios'][name] = await run_scenario(client, makers[name], requests, concurrency)
+                if name == 'create':
+                    async for plan in server.db.study_plans.find({}, {'sessions': 1}):
+                        plan_ids.append(str(plan['_id']))
+                        plan_sessions[str(plan['_id'])] = plan['sessions']
+    finally:
+        if backend == 'mongod':
+            await mongo_client.drop_database(db_name)
+        server.schedule_executor.shutdown()
+    return results
+
+
+def print_results(results: Dict):
+    print(f"backend={results['backend']} workload={results['workload']} concurrency={results['concurrency']}")
+    print(f"{'scenario':>16} {'req/s':>9} {'p50 (ms)':>9} {'p90 (ms)':>9} {'p99 (ms)':>9} {'errors':>7}")
+    for name, stats in results['scenarios'].items():
+        print(
+            f"{name:>16} {stats['throughput_rps']:>9.1f} {stats['p50_ms']:>9.2f} "
+            f"{stats['p90_ms']:>9.2f} {stats['p99_ms']:>9.2f} {stats['errors']:>7}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workload', default='medium', choices=['small', 'medium', 'large'])
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--mongo-url', default=os.environ.get('BENCHMARK_MONGO_URL'))
+    parser.add_argument('--json', action='store_true', help="print raw results as JSON")
+    args = parser.parse_args()
+
+    results = asyncio.run(run_api_benchmark(
+        args.workload, args.requests, args.concurrency, args.seed, args.mongo_url
+    ))
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_results(results)
+
+
+if __name__ == "__main__":
+    main()
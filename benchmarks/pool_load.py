@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Connection pool load test against a local mongod
+Runs the in-process API benchmark once per maxPoolSize at a fixed client
+concurrency and reports request p50/p99 next to pool checkout waits,
+checkout timeouts and the peak number of connections in use. Pool sizes
+well below the concurrency show up as checkout wait and a long p99 tail.
+
+    python benchmarks/pool_load.py --mongo-url mongodb://localhost:27017
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+
+import api_throughput
+from api_throughput import server
+
+from pymongo.errors import ServerSelectionTimeoutError
+
+POOL_SIZES = [2, 5, 10, 25, 50, 100]
+SCENARIOS = ['get', 'sessions_window', 'toggle']
+
+
+async def check_mongod(mongo_url: str):
+    from motor.motor_asyncio import AsyncIOMotorClient
+    probe = AsyncIOMotorClient(mongo_url, serverSelectionTimeoutMS=2000)
+    try:
+        await probe.admin.command('ping')
+    finally:
+        probe.close()
+
+
+def run(mongo_url: str, pool_sizes, concurrency: int, requests: int, wait_queue_timeout_ms: int, workload: str):
+    try:
+        asyncio.run(check_mongod(mongo_url))
+    except ServerSelectionTimeoutError:
+        print(f"No mongod reachable at {mongo_url}; this load test needs a real server")
+        return 1
+
+    print(f"concurrency={concurrency} requests={requests} waitQueueTimeoutMS={wait_queue_timeout_ms}")
+    print(
+        f"{'pool':>5} {'scenario':>16} {'req/s':>9} {'p50 (ms)':>9} {'p99 (ms)':>9} "
+        f"{'wait avg (ms)':>14} {'wait max (ms)':>14} {'timeouts':>9} {'peak in use':>12}"
+    )
+    for pool_size in pool_sizes:
+        monitor = server.PoolMonitor()
+        results = asyncio.run(api_throughput.run_api_benchmark(
+            workload, requests, concurrency,
+            mongo_url=mongo_url,
+            scenarios=SCENARIOS,
+            client_options={'maxPoolSize': pool_size, 'waitQueueTimeoutMS': wait_queue_timeout_ms},
+            pool_monitor=monitor,
+        ))
+        pool = monitor.stats()
+        wait_avg = pool['checkout_wait_total'] / pool['checkouts'] if pool['checkouts'] else 0.0
+        for name, stats in results['scenarios'].items():
+            print(
+                f"{pool_size:>5} {name:>16} {stats['throughput_rps']:>9.1f} {stats['p50_ms']:>9.2f} "
+                f"{stats['p99_ms']:>9.2f} {wait_avg * 1000:>14.3f} {pool['checkout_wait_max'] * 1000:>14.3f} "
+                f"{pool['checkout_timeouts']:>9} {pool['max_checked_out']:>12}"
+            )
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mongo-url', default=os.environ.get('BENCHMARK_MONGO_URL', 'mongodb://localhost:27017'))
+    parser.add_argument('--pool-sizes', default=','.join(str(size) for size in POOL_SIZES))
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--wait-queue-timeout-ms', type=int, default=5000)
+    parser.add_argument('--workload', default='medium', choices=['small', 'medium', 'large'])
+    args = parser.parse_args()
+
+    pool_sizes = [int(size) for size in args.pool_sizes.split(',') if size.strip()]
+    return run(args.mongo_url, pool_sizes, args.concurrency, args.requests, args.wait_queue_timeout_ms, args.workload)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Scaling benchmark for the scheduling engine
+Times plan generation (engine plus session dicts, as run by the worker pool)
+from 10 to 10,000 sessions to confirm it stays linear in the number of sessions
+"""
+
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+os.environ.setdefault('DB_NAME', 'benchmark_db')
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend'))
+
+from server import Subject, Topic, schedule_session_columns  # noqa: E402
+
+SIZES = [10, 100, 1000, 10000]
+DAILY_HOURS = 6
+
+
+def build_subjects(session_count, start):
+    """One strong topic of daily_hours / 2 yields exactly one session"""
+    exam_date = (start + timedelta(days=session_count)).date().isoformat()
+    topics = [
+        Topic(name=f"Topic {i}", difficulty="strong", hours_needed=DAILY_HOURS / 2)
+        for i in range(session_count)
+    ]
+    return [Subject(name="Benchmark", exam_date=exam_date, topics=topics)]
+
+
+def measure(sizes=SIZES, repeats=3):
+    """Best-of-`repeats` generation time in seconds per session count"""
+    start = datetime(2025, 1, 1)
+    results = {}
+    for size in sizes:
+        subjects = build_subjects(size, start)
+        best = float('inf')
+        for _ in range(repeats):
+            t0 = time.perf_counter()
+            schedule_session_columns(subjects, DAILY_HOURS, start.date().isoformat()).to_dicts()
+            best = min(best, time.perf_counter() - t0)
+        results[size] = best
+    return results
+
+
+def run(repeats=3):
+    print(f"{'sessions':>10} {'best (ms)':>12} {'per session (us)':>18}")
+    for size, best in measure(SIZES, repeats).items():
+        print(f"{size:>10} {best * 1000:>12.2f} {best / size * 1e6:>18.2f}")
+
+
+if __name__ == "__main__":
+    run()
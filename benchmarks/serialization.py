@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Serialization micro-benchmark for study plan responses
+Compares the previous path (StudyPlan(...).dict(), recursive serialize_doc,
+response_model validation, jsonable_encoder, json.dumps) with the orjson
+FastJSONResponse path for plans with 100, 1k and 10k sessions
+"""
+
+import json
+import os
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict
+
+os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+os.environ.setdefault('DB_NAME', 'benchmark_db')
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend'))
+
+from bson import ObjectId  # noqa: E402
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from pydantic import TypeAdapter  # noqa: E402
+
+from server import FastJSONResponse, StudyPlan, generate_study_schedule, public_doc  # noqa: E402
+from scheduler_scaling import DAILY_HOURS, build_subjects  # noqa: E402
+
+SIZES = [100, 1000, 10000]
+dict_adapter = TypeAdapter(Dict)
+
+
+def serialize_doc(doc):
+    """The recursive ObjectId walk the API used before FastJSONResponse"""
+    if isinstance(doc, dict):
+        result = {}
+        for key, value in doc.items():
+            if key == '_id' and isinstance(value, ObjectId):
+                result['id'] = str(value)
+            elif isinstance(value, ObjectId):
+                result[key] = str(value)
+            elif isinstance(value, dict):
+                result[key] = serialize_doc(value)
+            elif isinstance(value, list):
+                result[key] = [serialize_doc(item) if isinstance(item, (dict, ObjectId)) else item for item in value]
+            else:
+                result[key] = value
+        return result
+    elif isinstance(doc, ObjectId):
+        return str(doc)
+    elif isinstance(doc, list):
+        return [serialize_doc(item) if isinstance(item, (dict, ObjectId)) else item for item in doc]
+    else:
+        return doc
+
+
+def old_path(subjects, sessions, start_date):
+    plan = StudyPlan(subjects=subjects, daily_hours=DAILY_HOURS, start_date=start_date, sessions=sessions)
+    plan_dict = plan.dict(exclude={'id'})
+    plan_dict['_id'] = ObjectId()
+    content = serialize_doc(plan_dict)
+    validated = dict_adapter.validate_python(content)
+    return json.dumps(jsonable_encoder(validated)).encode()
+
+
+def new_path(subjects, sessions, start_date):
+    plan_dict = {
+        'subjects': [subject.dict() for subject in subjects],
+        'daily_hours': DAILY_HOURS,
+        'start_date': start_date,
+        'sessions': sessions,
+        'created_at': datetime.utcnow().isoformat(),
+        '_id': ObjectId(),
+    }
+    return FastJSONResponse(public_doc(plan_dict)).body
+
+
+def best_of(fn, *args, repeats=5):
+    best = float('inf')
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        body = fn(*args)
+        best = min(best, time.perf_counter() - t0)
+    return best, len(body)
+
+
+def run():
+    start_date = '2025-01-01'
+    print(f"{'sessions':>10} {'old (ms)':>10} {'new (ms)':>10} {'speedup':>8} {'bytes':>10}")
+    for size in SIZES:
+        subjects = build_subjects(size, datetime.fromisoformat(start_date))
+        sessions = [s.dict() for s in generate_study_schedule(subjects, DAILY_HOURS, start_date)]
+        old, _ = best_of(old_path, subjects, sessions, start_date)
+        new, size_bytes = best_of(new_path, subjects, sessions, start_date)
+        print(f"{len(sessions):>10} {old * 1000:>10.2f} {new * 1000:>10.2f} {old / new:>7.1f}x {size_bytes:>10}")
+
+
+if __name__ == "__main__":
+    run()
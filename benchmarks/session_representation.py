@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Memory and time benchmark for the scheduler's session representation
+Reports peak traced memory and time per 10k sessions for the compact
+columns, the dicts built from them, and full StudySession models
+"""
+
+import os
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+os.environ.setdefault('DB_NAME', 'benchmark_db')
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend'))
+
+from server import generate_study_schedule, schedule_session_columns  # noqa: E402
+from scheduler_scaling import DAILY_HOURS, build_subjects  # noqa: E402
+
+SESSIONS = 10000
+START_DATE = '2025-01-01'
+
+
+def columns_only(subjects):
+    return schedule_session_columns(subjects, DAILY_HOURS, START_DATE)
+
+
+def columns_to_dicts(subjects):
+    return schedule_session_columns(subjects, DAILY_HOURS, START_DATE).to_dicts()
+
+
+def models(subjects):
+    return generate_study_schedule(subjects, DAILY_HOURS, START_DATE)
+
+
+def measure(fn, subjects, repeats=3):
+    best = float('inf')
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        fn(subjects)
+        best = min(best, time.perf_counter() - t0)
+
+    tracemalloc.start()
+    result = fn(subjects)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak, len(result)
+
+
+def run():
+    subjects = build_subjects(SESSIONS, datetime.fromisoformat(START_DATE))
+    print(f"{'representation':>18} {'sessions':>10} {'time (ms)':>10} {'peak (KiB)':>11}")
+    for name, fn in (('columns', columns_only), ('columns -> dicts', columns_to_dicts), ('models', models)):
+        elapsed, peak, count = measure(fn, subjects)
+        print(f"{name:>18} {count:>10} {elapsed * 1000:>10.2f} {peak / 1024:>11.0f}")
+
+
+if __name__ == "__main__":
+    run()
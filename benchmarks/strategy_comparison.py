@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Quality and speed comparison of the scheduling strategies
+Runs every engine in SCHEDULING_STRATEGIES over the same seeded workloads
+(several subjects with staggered exams) and reports generation time along
+with constraint violations and how evenly the study load is spread. The
+'tight' load squeezes the exams until, from 100 topics on, the work needs
+more than the 9:00-21:00 window holds.
+"""
+
+import os
+import random
+import statistics
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from pathlib import Path
+
+os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+os.environ.setdefault('DB_NAME', 'benchmark_db')
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend'))
+
+from server import SCHEDULING_STRATEGIES, InfeasiblePlanError, Subject, Topic  # noqa: E402
+
+TOPIC_COUNTS = [10, 100, 1000]
+# Days until the last exam per topic, floored at two weeks
+LOADS = {'roomy': 0.5, 'tight': 0.125}
+DAILY_HOURS = 6
+WINDOW_END = 21 * 60
+
+
+def build_subjects(topic_count, start, rng, days_per_topic=0.5):
+    """Four subjects with exams spread over `days_per_topic` days per topic"""
+    days = max(14, int(topic_count * days_per_topic))
+    subjects = []
+    for index in range(4):
+        exam_date = (start + timedelta(days=days * (index + 2) // 5)).date().isoformat()
+        topics = [
+            Topic(
+                name=f"Topic {i}",
+                difficulty=rng.choice(['weak', 'strong']),
+                hours_needed=rng.uniform(1, 4),
+            )
+            for i in range(topic_count // 4)
+        ]
+        subjects.append(Subject(name=f"Subject {index}", exam_date=exam_date, topics=topics))
+    return subjects
+
+
+def minutes(hhmm):
+    hours, mins = hhmm.split(':')
+    return int(hours) * 60 + int(mins)
+
+
+def quality(subjects, sessions):
+    """Violations and load spread of a generated schedule"""
+    exams = {subject.name: subject.exam_date[:10] for subject in subjects}
+    daily = defaultdict(float)
+    by_day = defaultdict(list)
+    after_exam = past_window = overlaps = 0
+    for session in sessions:
+        daily[session['date']] += session['duration']
+        by_day[session['date']].append((minutes(session['start_time']), minutes(session['end_time'])))
+        after_exam += session['date'] >= exams[session['subject']]
+        past_window += minutes(session['end_time']) > WINDOW_END
+    for slots in by_day.values():
+        slots.sort()
+        overlaps += sum(1 for a, b in zip(slots, slots[1:]) if b[0] < a[1])
+    loads = list(daily.values())
+    return {
+        'after_exam': after_exam,
+        'past_21h': past_window,
+        'overlaps': overlaps,
+        'peak_day_h': max(loads),
+        'stdev_h': statistics.pstdev(loads),
+    }
+
+
+def run(repeats=3, seed=7):
+    start = datetime(2025, 1, 1)
+    header = (
+        f"{'load':>6} {'topics':>7} {'strategy':>9} {'best (ms)':>10} {'sessions':>9} "
+        f"{'after exam':>11} {'past 21h':>9} {'overlaps':>9} {'peak day h':>11} {'stdev h':>8}"
+    )
+    print(header)
+    for load, days_per_topic in LOADS.items():
+        for topic_count in TOPIC_COUNTS:
+            subjects = build_subjects(topic_count, start, random.Random(seed), days_per_topic)
+            for name, engine in SCHEDULING_STRATEGIES.items():
+                best = float('inf')
+                try:
+                    for _ in range(repeats):
+                        t0 = time.perf_counter()
+                        sessions = engine(subjects, DAILY_HOURS, start.date().isoformat()).to_dicts()
+                        best = min(best, time.perf_counter() - t0)
+                except InfeasiblePlanError:
+                    print(f"{load:>6} {topic_count:>7} {name:>9} {'does not fit before the exams':>40}")
+                    continue
+                q = quality(subjects, sessions)
+                print(
+                    f"{load:>6} {topic_count:>7} {name:>9} {best * 1000:>10.2f} {len(sessions):>9} "
+                    f"{q['after_exam']:>11} {q['past_21h']:>9} {q['overlaps']:>9} "
+                    f"{q['peak_day_h']:>11.2f} {q['stdev_h']:>8.2f}"
+                )
+
+
+if __name__ == "__main__":
+    run()
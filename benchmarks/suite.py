@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite with JSON baselines
+Runs the scheduler scaling benchmark and the in-process API benchmark,
+writes the results as flat JSON metrics, and compares them with a saved
+baseline. Any metric that regresses by more than --threshold fails the run
+with exit code 1. Baselines are machine specific: record one with
+--save-baseline on the machine that will run the comparison.
+
+    python benchmarks/suite.py --save-baseline   # record a baseline
+    python benchmarks/suite.py                   # compare against it
+
+benchmarks/ is a directory of scripts, not a package: run each one by path
+as above (from any directory); the scripts import each other and the
+backend's server module as top-level names.
+"""
+
+import argparse
+import asyncio
+import json
+import platform
+import sys
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List
+
+import api_throughput
+import scheduler_scaling
+
+BENCHMARK_DIR = Path(__file__).resolve().parent
+DEFAULT_BASELINE = BENCHMARK_DIR / 'baselines' / 'baseline.json'
+DEFAULT_OUTPUT = BENCHMARK_DIR / 'results' / 'latest.json'
+DEFAULT_THRESHOLD = 0.25
+NOISE_FLOOR_MS = 0.05  # absolute changes below this never count as regressions
+QUICK_SIZES = [10, 100, 1000]
+API_LATENCY_KEYS = ('p50_ms', 'p90_ms', 'p99_ms')
+
+
+def higher_is_better(metric: str) -> bool:
+    return metric.endswith('_rps')
+
+
+def collect(quick: bool, workload: str, requests: int, concurrency: int, mongo_url: str = None) -> Dict:
+    metrics = {}
+    sizes = QUICK_SIZES if quick else scheduler_scaling.SIZES
+    for size, best in scheduler_scaling.measure(sizes, repeats=3 if quick else 5).items():
+        metrics[f"scheduler.generate.{size}_sessions_ms"] = best * 1000
+
+    api = asyncio.run(api_throughput.run_api_benchmark(
+        workload, requests, concurrency, mongo_url=mongo_url
+    ))
+    for scenario, stats in api['scenarios'].items():
+        metrics[f"api.{scenario}.throughput_rps"] = stats['throughput_rps']
+        for key in API_LATENCY_KEYS:
+            metrics[f"api.{scenario}.{key}"] = stats[key]
+        metrics[f"api.{scenario}.errors"] = stats['errors']
+
+    return {
+        'meta': {
+            'created_at': datetime.utcnow().isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'backend': api['backend'],
+            'workload': workload,
+            'requests': requests,
+            'concurrency': concurrency,
+            'quick': quick,
+        },
+        'metrics': metrics,
+    }
+
+
+def compare(baseline: Dict, current: Dict, threshold: float) -> List[Dict]:
+    """Per-metric change against the baseline; `regressed` marks failures"""
+    rows = []
+    for metric, base in sorted(baseline['metrics'].items()):
+        value = current['metrics'].get(metric)
+        if value is None:
+            continue
+        if metric.endswith('.errors'):
+            rows.append({'metric': metric, 'baseline': base, 'current': value,
+                         'change': value - base, 'regressed': value > base})
+            continue
+        if base == 0:
+            continue
+        change = (value - base) / base
+        worse = -change if higher_is_better(metric) else change
+        regressed = worse > threshold
+        if regressed and metric.endswith('_ms') and abs(value - base) < NOISE_FLOOR_MS:
+            regressed = False
+        rows.append({'metric': metric, 'baseline': base, 'current': value,
+                     'change': change, 'regressed': regressed})
+    return rows
+
+
+def print_comparison(rows: List[Dict]):
+    print(f"{'metric':<44} {'baseline':>12} {'current':>12} {'change':>9}")
+    for row in rows:
+        if row['metric'].endswith('.errors'):
+            change = f"{row['change']:+d}"
+        else:
+            change = f"{row['change'] * 100:+.1f}%"
+        flag = '  REGRESSION' if row['regressed'] else ''
+        print(f"{row['metric']:<44} {row['baseline']:>12.3f} {row['current']:>12.3f} {change:>9}{flag}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--baseline', type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument('--output', type=Path, default=DEFAULT_OUTPUT)
+    parser.add_argument('--save-baseline', action='store_true', help="write the results as the new baseline")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help="allowed fractional regression per metric (default 0.25)")
+    parser.add_argument('--quick', action='store_true', help="smaller scheduler sizes and fewer repeats")
+    parser.add_argument('--workload', default='medium', choices=['small', 'medium', 'large'])
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--mongo-url', default=None, help="local mongod instead of mongomock")
+    args = parser.parse_args()
+
+    current = collect(args.quick, args.workload, args.requests, args.concurrency, args.mongo_url)
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    args.output.write_text(json.dumps(current, indent=2, sort_keys=True))
+    print(f"Results written to {args.output}")
+
+    if args.save_baseline:
+        args.baseline.parent.mkdir(parents=True, exist_ok=True)
+        args.baseline.write_text(json.dumps(current, indent=2, sort_keys=True))
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+
+    if not args.baseline.exists():
+        print(f"No baseline at {args.baseline}; run with --save-baseline first")
+        return 0
+
+    baseline = json.loads(args.baseline.read_text())
+    for key in ('backend', 'workload', 'requests', 'concurrency', 'quick'):
+        if baseline['meta'].get(key) != current['meta'][key]:
+            print(f"warning: baseline {key}={baseline['meta'].get(key)!r} differs from this run ({current['meta'][key]!r})")
+
+    rows = compare(baseline, current, args.threshold)
+    print_comparison(rows)
+    regressions = [row['metric'] for row in rows if row['regressed']]
+    if regressions:
+        print(f"{len(regressions)} metric(s) regressed by more than {args.threshold:.0%}")
+        return 1
+    print("No regressions beyond the threshold")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
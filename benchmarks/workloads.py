@@ -0,0 +1,66 @@
+"""
+Synthetic workload generators for the benchmarks
+Builds subjects, topics and exam spreads from a seeded random.Random so
+every run of a benchmark sees the same inputs
+"""
+
+import random
+from datetime import date, timedelta
+from typing import Dict, List
+
+# Days from the start date to the first and the last exam
+EXAM_SPREADS = {
+    'clustered': (7, 14),
+    'spread': (14, 60),
+    'term': (30, 120),
+}
+
+# Named plan shapes used by the API benchmark
+WORKLOADS = {
+    'small': {'subject_count': 3, 'topics_per_subject': 5, 'exam_spread': 'clustered', 'daily_hours': 4},
+    'medium': {'subject_count': 5, 'topics_per_subject': 20, 'exam_spread': 'spread', 'daily_hours': 6},
+    'large': {'subject_count': 8, 'topics_per_subject': 60, 'exam_spread': 'term', 'daily_hours': 8},
+}
+
+START_DATE = date(2025, 1, 1)
+
+
+def make_subjects(
+    rng: random.Random,
+    subject_count: int,
+    topics_per_subject: int,
+    exam_spread: str = 'spread',
+    start: date = START_DATE,
+    weak_ratio: float = 0.5,
+    hours_range: tuple = (1.0, 4.0),
+) -> List[Dict]:
+    """Subject payloads with exams spread evenly over the chosen window"""
+    first, last = EXAM_SPREADS[exam_spread]
+    subjects = []
+    for index in range(subject_count):
+        offset = first + (last - first) * index // max(1, subject_count - 1)
+        topics = [
+            {
+                'name': f"Topic {index}.{n}",
+                'difficulty': 'weak' if rng.random() < weak_ratio else 'strong',
+                'hours_needed': round(rng.uniform(*hours_range), 2),
+            }
+            for n in range(topics_per_subject)
+        ]
+        subjects.append({
+            'name': f"Subject {index}",
+            'exam_date': (start + timedelta(days=offset)).isoformat(),
+            'topics': topics,
+        })
+    return subjects
+
+
+def make_plan_payload(rng: random.Random, workload: str = 'medium', start: date = START_DATE) -> Dict:
+    """A POST /api/study-plans body for a named workload"""
+    shape = dict(WORKLOADS[workload])
+    daily_hours = shape.pop('daily_hours')
+    return {
+        'subjects': make_subjects(rng, start=start, **shape),
+        'daily_hours': daily_hours,
+        'start_date': start.isoformat(),
+    }
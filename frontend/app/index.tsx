@@ -14,9 +14,18 @@ export default function HomeScreen() {
 
   const fetchPlans = async () => {
     try {
-      const response = await fetch(`${EXPO_PUBLIC_BACKEND_URL}/api/study-plans`);
-      const data = await response.json();
-      setPlans(data);
+      // The list is paged: follow X-Next-Cursor until every plan is loaded
+      let allPlans = [];
+      let cursor = null;
+      do {
+        const params = new URLSearchParams({ limit: '100' });
+        if (cursor) params.set('cursor', cursor);
+        const response = await fetch(`${EXPO_PUBLIC_BACKEND_URL}/api/study-plans?${params}`);
+        if (!response.ok) break;
+        allPlans = allPlans.concat(await response.json());
+        cursor = response.headers.get('X-Next-Cursor');
+      } while (cursor);
+      setPlans(allPlans);
     } catch (error) {
       console.error('Error fetching plans:', error);
     }
@@ -1,4 +1,4 @@
-import React, { useEffect, useState } from 'react';
+import React, { useEffect, useRef, useState } from 'react';
 import {
   View,
   Text,
@@ -36,6 +36,7 @@ interface StudyPlan {
   daily_hours: number;
   start_date: string;
   sessions: Session[];
+  version?: number;
 }
 
 export default function ScheduleScreen() {
@@ -45,6 +46,7 @@ export default function ScheduleScreen() {
   const [plan, setPlan] = useState<StudyPlan | null>(null);
   const [selectedDate, setSelectedDate] = useState(new Date().toISOString().split('T')[0]);
   const [viewMode, setViewMode] = useState<'calendar' | 'list'>('calendar');
+  const etag = useRef<string | null>(null);
   const EXPO_PUBLIC_BACKEND_URL = process.env.EXPO_PUBLIC_BACKEND_URL;
 
   useEffect(() => {
@@ -53,11 +55,18 @@ export default function ScheduleScreen() {
 
   const fetchPlan = async () => {
     try {
-      const response = await fetch(`${EXPO_PUBLIC_BACKEND_URL}/api/study-plans/${id}`);
+      // Revalidate with the last ETag; 304 means the plan we hold is current
+      const response = await fetch(`${EXPO_PUBLIC_BACKEND_URL}/api/study-plans/${id}`, {
+        headers: etag.current ? { 'If-None-Match': etag.current } : {},
+      });
+      if (response.status === 304) {
+        return;
+      }
       if (!response.ok) {
         throw new Error('Failed to fetch study plan');
       }
       const data = await response.json();
+      etag.current = response.headers.get('ETag');
       setPlan(data);
     } catch (error) {
       console.error('Error fetching plan:', error);
@@ -91,8 +100,18 @@ export default function ScheduleScreen() {
         throw new Error('Failed to update session');
       }
 
-      const updatedPlan = await response.json();
-      setPlan(updatedPlan);
+      // The API returns only the changed session, so patch it in locally
+      const update = await response.json();
+      setPlan((current) =>
+        current && {
+          ...current,
+          sessions: current.sessions.map((s) =>
+            s.date === update.date && s.subject === update.subject && s.topic === update.topic
+              ? { ...s, completed: update.completed }
+              : s
+          ),
+        }
+      );
     } catch (error) {
       console.error('Error updating session:', error);
       Alert.alert('Error', 'Failed to update session status');
@@ -0,0 +1,93 @@
+"""
+Startup index management for study_plans
+Index creation is checked against mongomock; query plans are checked with
+explain() when a real mongod is reachable at MONGO_URL
+"""
+
+import asyncio
+import os
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+
+os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+os.environ.setdefault('DB_NAME', 'test_database')
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend'))
+
+server = pytest.importorskip('server')
+
+
+def winning_index_names(explain):
+    """Collect every index name used by the winning plan"""
+    names = set()
+    stack = [explain['queryPlanner']['winningPlan']]
+    while stack:
+        stage = stack.pop()
+        if 'indexName' in stage:
+            names.add(stage['indexName'])
+        stack.extend(stage.get('inputStages', []))
+        if 'inputStage' in stage:
+            stack.append(stage['inputStage'])
+        if 'queryPlan' in stage:
+            stack.append(stage['queryPlan'])
+    return names
+
+
+@pytest.fixture
+def mock_db(monkeypatch):
+    mongomock_motor = pytest.importorskip('mongomock_motor')
+    database = mongomock_motor.AsyncMongoMockClient()['test_database']
+    monkeypatch.setattr(server, 'db', database)
+    return database
+
+
+@pytest.fixture
+def live_db(monkeypatch):
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from pymongo import MongoClient
+    from pymongo.errors import PyMongoError
+
+    sync_client = MongoClient(os.environ['MONGO_URL'], serverSelectionTimeoutMS=500)
+    try:
+        sync_client.admin.command('ping')
+    except PyMongoError:
+        pytest.skip('no mongod reachable at MONGO_URL')
+
+    name = 'study_scheduler_index_test'
+    sync_client.drop_database(name)
+    monkeypatch.setattr(server, 'db', AsyncIOMotorClient(os.environ['MONGO_URL'])[name])
+    yield sync_client[name]
+    sync_client.drop_database(name)
+    sync_client.close()
+
+
+def test_ensure_indexes_is_idempotent(mock_db):
+    asyncio.run(server.ensure_indexes())
+    asyncio.run(server.ensure_indexes())
+
+    info = asyncio.run(mock_db.study_plans.index_information())
+    assert {'_id_', 'created_at_desc', 'sessions_date_completed'} <= set(info)
+    assert list(info['created_at_desc']['key']) == [('created_at', -1), ('_id', -1)]
+
+
+def test_query_plans_use_indexes(live_db):
+    asyncio.run(server.ensure_indexes())
+
+    start = datetime(2025, 1, 1)
+    live_db.study_plans.insert_many([
+        {
+            'created_at': (start + timedelta(minutes=i)).isoformat(),
+            'sessions': [
+                {'id': 's0', 'date': (start + timedelta(days=i % 30)).date().isoformat(), 'completed': i % 2 == 0},
+            ],
+        }
+        for i in range(200)
+    ])
+
+    listing = live_db.study_plans.find().sort([('created_at', -1), ('_id', -1)]).limit(20).explain()
+    assert 'created_at_desc' in winning_index_names(listing)
+
+    by_day = live_db.study_plans.find({'sessions.date': '2025-01-05', 'sessions.completed': False}).explain()
+    assert 'sessions_date_completed' in winning_index_names(by_day)
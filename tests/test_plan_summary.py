@@ -0,0 +1,101 @@
+"""
+Per-plan summaries behind the agenda endpoint
+Runs against mongomock with plans stored in study_sessions, where the
+summary is moved by completion writes and rebuilt by the agenda when it is
+missing
+"""
+
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+import orjson
+import pytest
+
+os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+os.environ.setdefault('DB_NAME', 'test_database')
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend'))
+
+server = pytest.importorskip('server')
+
+SUBJECTS = [
+    {'name': 'Physics', 'exam_date': '2025-01-20', 'topics': []},
+    {'name': 'Maths', 'exam_date': '2025-01-25', 'topics': []},
+]
+SESSIONS = [
+    {'id': 's0', 'subject': 'Physics', 'topic': 'Mechanics', 'date': '2025-01-02',
+     'start_time': '09:00', 'end_time': '11:00', 'duration': 2.0, 'completed': False},
+    {'id': 's1', 'subject': 'Maths', 'topic': 'Algebra', 'date': '2025-01-02',
+     'start_time': '11:00', 'end_time': '12:30', 'duration': 1.5, 'completed': True},
+    {'id': 's2', 'subject': 'Physics', 'topic': 'Optics', 'date': '2025-01-03',
+     'start_time': '09:00', 'end_time': '12:00', 'duration': 3.0, 'completed': False},
+]
+
+
+@pytest.fixture
+def collection_plan(monkeypatch):
+    mongomock_motor = pytest.importorskip('mongomock_motor')
+    database = mongomock_motor.AsyncMongoMockClient()['test_database']
+    monkeypatch.setattr(server, 'db', database)
+    monkeypatch.setattr(server, 'SESSION_STORAGE', 'collection')
+    plan = {
+        'subjects': SUBJECTS,
+        'daily_hours': 4,
+        'start_date': '2025-01-01',
+        'sessions': [dict(session) for session in SESSIONS],
+        'version': 1,
+        'summary': server.build_plan_summary(SUBJECTS, SESSIONS),
+    }
+    plan_oid = asyncio.run(server.insert_plan(plan))
+    return database, plan_oid
+
+
+def agenda(plan_oid, day):
+    response = asyncio.run(server.get_agenda(str(plan_oid), day))
+    return orjson.loads(response.body)
+
+
+def stored_summary(database, plan_oid):
+    return asyncio.run(database.study_plans.find_one({'_id': plan_oid}))['summary']
+
+
+def test_agenda_rebuilds_a_missing_summary_from_the_session_collection(collection_plan):
+    database, plan_oid = collection_plan
+    asyncio.run(database.study_plans.update_one({'_id': plan_oid}, {'$unset': {'summary': ''}}))
+
+    body = agenda(plan_oid, '2025-01-02')
+    assert body['totals'] == {'sessions': 2, 'completed': 1, 'hours': 3.5, 'completed_hours': 1.5}
+    assert [session['id'] for session in body['sessions']] == ['s0', 's1']
+    physics = next(subject for subject in body['subjects'] if subject['name'] == 'Physics')
+    assert (physics['sessions'], physics['hours']) == (2, 5.0)
+
+    summary = stored_summary(database, plan_oid)
+    assert summary == server.build_plan_summary(SUBJECTS, SESSIONS)
+
+
+def test_completion_moves_the_summary_counters(collection_plan):
+    database, plan_oid = collection_plan
+    changed = asyncio.run(server.apply_session_completion(
+        plan_oid, [({'id': {'$in': ['s0', 's2']}}, True), ({'id': 's1'}, False)]
+    ))
+    assert changed is True
+
+    summary = stored_summary(database, plan_oid)
+    sessions = [dict(session, completed=session['id'] != 's1') for session in SESSIONS]
+    assert summary == server.build_plan_summary(SUBJECTS, sessions)
+
+    body = agenda(plan_oid, '2025-01-03')
+    assert body['totals']['completed_hours'] == 3.0
+
+
+def test_bulk_patch_lists_ids_the_plan_does_not_have(collection_plan):
+    database, plan_oid = collection_plan
+    bulk = server.BulkPatchSessions(sessions=[
+        {'id': 's0', 'completed': True},
+        {'id': 'zzz', 'completed': True},
+    ])
+    body = asyncio.run(server.bulk_patch_sessions(str(plan_oid), bulk))
+    assert body['sessions'] == [{'id': 's0', 'completed': True}]
+    assert body['unknown_ids'] == ['zzz']
+    assert stored_summary(database, plan_oid)['days']['2025-01-02']['completed'] == 2
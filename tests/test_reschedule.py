@@ -0,0 +1,76 @@
+"""
+Incremental reschedule
+Runs against mongomock, with plans stored in study_sessions and schedules
+generated on a thread pool. Sessions
+kept on a rescheduled day are followed, not overlapped, by the new ones,
+and the new daily_hours caps those days
+"""
+
+import asyncio
+import os
+import sys
+from collections import defaultdict
+from pathlib import Path
+
+import pytest
+
+os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+os.environ.setdefault('DB_NAME', 'test_database')
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend'))
+
+server = pytest.importorskip('server')
+
+
+@pytest.fixture
+def database(monkeypatch):
+    mongomock_motor = pytest.importorskip('mongomock_motor')
+    database = mongomock_motor.AsyncMongoMockClient()['test_database']
+    monkeypatch.setattr(server, 'db', database)
+    monkeypatch.setattr(server, 'SESSION_STORAGE', 'collection')
+    executor = server.ScheduleExecutor('thread', 1, 4)
+    monkeypatch.setattr(server, 'schedule_executor', executor)
+    yield database
+    executor.shutdown()
+
+
+def create_plan(plan):
+    return asyncio.run(server.create_plan_document(server.StudyPlanCreate(**plan)))
+
+
+def stored_sessions(database, plan_oid):
+    cursor = database.study_sessions.find({'plan_id': plan_oid}).sort([('date', 1), ('start_time', 1)])
+    return asyncio.run(cursor.to_list(None))
+
+
+def minutes(hhmm):
+    hours, mins = hhmm.split(':')
+    return int(hours) * 60 + int(mins)
+
+
+def test_new_sessions_follow_the_kept_ones(database):
+    plan = create_plan({
+        'subjects': [
+            {'name': 'Maths', 'exam_date': '2025-01-20', 'topics': [{'name': 'Alg', 'difficulty': 'weak', 'hours_needed': 6}]},
+            {'name': 'Geography', 'exam_date': '2025-01-25', 'topics': [{'name': 'Geo', 'difficulty': 'strong', 'hours_needed': 7}]},
+        ],
+        'daily_hours': 6,
+        'start_date': '2025-01-01',
+    })
+    plan_oid = plan['_id']
+    first = stored_sessions(database, plan_oid)[0]
+    assert (first['start_time'], first['end_time']) == ('09:00', '12:00')
+    asyncio.run(server.apply_session_completion(plan_oid, [({'id': first['id']}, True)]))
+
+    asyncio.run(server.reschedule_study_plan(
+        str(plan_oid), server.RescheduleRequest(from_date=first['date'], daily_hours=3)
+    ))
+
+    by_day = defaultdict(list)
+    for session in stored_sessions(database, plan_oid):
+        by_day[session['date']].append((minutes(session['start_time']), minutes(session['end_time'])))
+    for slots in by_day.values():
+        slots.sort()
+        assert all(b[0] >= a[1] for a, b in zip(slots, slots[1:])), slots
+    # The kept 3h session fills the first day at daily_hours=3
+    assert by_day[first['date']] == [(9 * 60, 12 * 60)]
+    assert all(sum(end - start for start, end in slots) <= 3 * 60 for day, slots in by_day.items() if day > first['date'])
@@ -0,0 +1,145 @@
+"""
+Earliest-deadline-first scheduling engine
+Checks that sessions land before their exams, that daily load respects
+daily_hours (or the 9:00-21:00 window when catching up), that times are
+valid HH:MM inside the window, and that work which cannot fit is reported
+"""
+
+import os
+import random
+import sys
+from collections import defaultdict
+from datetime import date, timedelta
+from pathlib import Path
+
+import pytest
+
+os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+os.environ.setdefault('DB_NAME', 'test_database')
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend'))
+
+server = pytest.importorskip('server')
+
+START = date(2025, 1, 1)
+
+
+def subject(name, exam_in_days, topics):
+    return server.Subject(
+        name=name,
+        exam_date=(START + timedelta(days=exam_in_days)).isoformat(),
+        topics=[server.Topic(name=f"{name} {n}", difficulty=difficulty, hours_needed=hours)
+                for n, (difficulty, hours) in enumerate(topics)],
+    )
+
+
+def schedule(subjects, daily_hours):
+    columns = server.schedule_session_columns_edf(subjects, daily_hours, START.isoformat())
+    return columns.to_dicts()
+
+
+def daily_load(sessions):
+    load = defaultdict(float)
+    for session in sessions:
+        load[session['date']] += session['duration']
+    return load
+
+
+def minutes(hhmm):
+    hours, mins = hhmm.split(':')
+    return int(hours) * 60 + int(mins)
+
+
+def assert_valid_times(sessions):
+    by_day = defaultdict(list)
+    for session in sessions:
+        start, end = minutes(session['start_time']), minutes(session['end_time'])
+        assert 9 * 60 <= start < end <= 21 * 60, session
+        by_day[session['date']].append((start, end))
+    for slots in by_day.values():
+        slots.sort()
+        assert all(b[0] >= a[1] for a, b in zip(slots, slots[1:])), slots
+
+
+def test_sessions_come_before_their_exams():
+    subjects = [
+        subject('Physics', 6, [('weak', 4), ('strong', 3), ('weak', 2)]),
+        subject('Maths', 12, [('strong', 5), ('weak', 3)]),
+    ]
+    sessions = schedule(subjects, 4)
+    exams = {s.name: s.exam_date for s in subjects}
+    assert sessions
+    assert all(session['date'] < exams[session['subject']] for session in sessions)
+    scheduled = sum(session['duration'] for session in sessions)
+    assert scheduled == pytest.approx(4 * 1.5 + 3 + 2 * 1.5 + 5 + 3 * 1.5)
+
+
+def test_daily_hours_caps_each_day_when_the_work_fits():
+    rng = random.Random(5)
+    subjects = [
+        subject(f"S{index}", 20 + 10 * index, [(rng.choice(['weak', 'strong']), rng.uniform(1, 4)) for _ in range(6)])
+        for index in range(3)
+    ]
+    sessions = schedule(subjects, 3)
+    assert max(daily_load(sessions).values()) <= 3 + 1e-9
+    assert_valid_times(sessions)
+
+
+def test_overload_is_levelled_across_the_days_before_the_exam():
+    # 50h due in five days: beyond daily_hours, but it fits in the window
+    subjects = [subject('History', 5, [('strong', 10)] * 5)]
+    sessions = schedule(subjects, 2)
+    load = daily_load(sessions)
+    assert len(load) == 5
+    assert max(load.values()) - min(load.values()) <= 2 + 1e-9
+    assert max(load.values()) <= 12
+    assert_valid_times(sessions)
+
+
+def test_large_loads_keep_times_inside_the_window():
+    rng = random.Random(11)
+    subjects = [
+        subject(f"S{index}", 60 + 15 * index, [(rng.choice(['weak', 'strong']), rng.uniform(1, 4)) for _ in range(80)])
+        for index in range(4)
+    ]
+    sessions = schedule(subjects, 6)
+    assert_valid_times(sessions)
+    assert max(daily_load(sessions).values()) <= 12 + 1e-9
+
+
+def test_work_that_cannot_fit_is_reported():
+    subjects = [subject('Chemistry', 1, [('weak', 100)] * 10)]
+    with pytest.raises(server.InfeasiblePlanError, match='Chemistry'):
+        schedule(subjects, 4)
+
+
+def test_work_that_fits_the_window_is_not_rejected():
+    # ~90h due within 14 days: on budget each day, the walk alone left a
+    # session past the S2 exam that earlier days still had room for
+    subjects = [
+        subject('S0', 12, [('weak', 9.52), ('strong', 9.04), ('strong', 4.86)]),
+        subject('S1', 42, [('strong', 3.15), ('weak', 6.84), ('strong', 10.13),
+                           ('strong', 3.25), ('weak', 1.73), ('strong', 10.91)]),
+        subject('S2', 14, [('strong', 6.24), ('weak', 11.95), ('weak', 2.13), ('weak', 2.38),
+                           ('strong', 7.82), ('strong', 1.53), ('weak', 10.28), ('strong', 2.69)]),
+    ]
+    sessions = schedule(subjects, 8)
+    exams = {s.name: s.exam_date for s in subjects}
+    assert all(session['date'] < exams[session['subject']] for session in sessions)
+    assert max(daily_load(sessions).values()) <= 12 + 1e-9
+    assert_valid_times(sessions)
+
+
+def test_back_to_back_sessions_never_overlap():
+    rng = random.Random(0)
+    for _ in range(300):
+        subjects = [
+            subject(f"S{index}", rng.randint(3, 45),
+                    [(rng.choice(['weak', 'strong']), round(rng.uniform(0.5, 12), 2))
+                     for _ in range(rng.randint(1, 8))])
+            for index in range(rng.randint(1, 4))
+        ]
+        try:
+            sessions = schedule(subjects, rng.choice([2, 3, 4, 6, 8, 10]))
+        except server.InfeasiblePlanError:
+            continue
+        assert_valid_times(sessions)